@@ -0,0 +1,557 @@
+import numpy as np
+
+from board import IDENTITY, Move, PLACEMENT_DTYPE, chebyshev_distance_map, transform_array
+from placements import get_placement_table
+import zobrist
+
+"""
+A Board implementation that keeps the game state in packed integer bitboards.
+"""
+
+
+class BitBoard(object):
+
+    """
+    A BitBoard describes the same game state as board.Board and exposes the
+    same interface, so it can be used anywhere a Board is expected.
+
+    Instead of NumPy arrays, every layer of the state is a Python int with one
+    bit per cell (bit y * board_w + x):
+    - tiles[player]: the cells covered by <player>'s tiles
+    - occupied: the cells covered by any player
+    - blocked[player]: the cells <player> can't play on (the complement of
+      Board._legal)
+    - corners[player]: the cells diagonally attached to one of <player>'s
+      tiles or their corner (Board.connected)
+    - available[player]: bit k is set iff <player> still holds piece k
+
+    Like a Board, a BitBoard can maintain target_dists for targets registered
+    with track_targets, remembers its last_move, and keeps its zobrist_key
+    up to date. _reachable and _previous_reachable hold layers rather than
+    arrays.
+
+    Moves are generated and applied through the PlacementTable of the board,
+    so checking a move is a couple of mask tests.
+
+    Copying a BitBoard only copies a few short lists of ints, and comparing
+    boards is a few integer operations.
+    """
+
+    def __init__(self, board_w, board_h, num_players, piece_list, starting_point=(0, 0)):
+        self.board_w = board_w
+        self.board_h = board_h
+        self.num_players = num_players
+        self.scores = [0] * self.num_players
+
+        self.full_mask = (1 << (board_w * board_h)) - 1
+        first_col = 0
+        for y in range(board_h):
+            first_col |= 1 << (y * board_w)
+        last_col = first_col << (board_w - 1)
+        self.not_first_col = self.full_mask & ~first_col
+        self.not_last_col = self.full_mask & ~last_col
+
+        self.occupied = 0
+        self.tiles = [0] * num_players
+        self.blocked = [0] * num_players
+        self.corners = [0] * num_players
+        self.corners[0] = self._bit(starting_point[1], starting_point[0])
+
+        self.piece_list = piece_list
+        self.available = [(1 << piece_list.get_num_pieces()) - 1] * num_players
+        self.placements = get_placement_table(piece_list, board_w, board_h)
+        self.zobrist = zobrist.get_zobrist_table(num_players, piece_list, board_w, board_h)
+        self.zobrist_key = 0
+        self.targets = ()
+        self.target_dists = []
+        self.last_move = None
+        self._distance_maps = {}
+        self._reachable = {}
+        self._previous_reachable = {}
+
+    def _bit(self, x, y):
+        return 1 << (y * self.board_w + x)
+
+    def set_starting_point(self, player, starting_point):
+        """
+        Attach the cell <starting_point> (given as (row, column)) to <player>,
+        allowing their first piece to be placed there.
+        """
+        self.corners[player] |= self._bit(starting_point[1], starting_point[0])
+
+    def _get_placement_id(self, move):
+        """
+        Return the id of <move> in this board's PlacementTable, or None if it
+        didn't come from this table.
+        """
+        table = self.placements
+        placement_id = move.placement_id
+        if (placement_id is not None and placement_id < len(table) and
+                table.x[placement_id] == move.x and table.y[placement_id] == move.y and
+                table.piece_index[placement_id] == move.piece_index and
+                table.orientations[move.piece_index][table.orientation[placement_id]] == move.orientation):
+            return placement_id
+        return None
+
+    def move_mask(self, move):
+        """
+        Return the bitboard of the cells covered by <move>, or None if any of
+        them is out of bounds.
+        """
+        placement_id = self._get_placement_id(move)
+        if placement_id is not None:
+            return self.placements.cells[placement_id]
+        mask = 0
+        for (xi, yi) in move.orientation:
+            (x, y) = (xi + move.x, yi + move.y)
+            if x < 0 or x >= self.board_w or y < 0 or y >= self.board_h:
+                return None
+            mask |= self._bit(x, y)
+        return mask
+
+    def edge_neighbours(self, mask):
+        """
+        Return the cells sharing an edge with any cell of <mask>.
+        """
+        return (((mask << 1) & self.not_first_col) |
+                ((mask >> 1) & self.not_last_col) |
+                (mask << self.board_w) |
+                (mask >> self.board_w)) & self.full_mask
+
+    def corner_neighbours(self, mask):
+        """
+        Return the cells sharing a corner with any cell of <mask>.
+        """
+        w = self.board_w
+        return (((mask << (w + 1)) & self.not_first_col) |
+                ((mask << (w - 1)) & self.not_last_col) |
+                ((mask >> (w - 1)) & self.not_first_col) |
+                ((mask >> (w + 1)) & self.not_last_col)) & self.full_mask
+
+    def track_targets(self, targets):
+        """
+        Start maintaining target_dists for the (row, column) cells <targets>.
+
+        See Board.track_targets.
+        """
+        self.targets = tuple(targets)
+        dist_map = self.get_distance_map()
+        self.target_dists = [dist_map[ty, tx].item() for (ty, tx) in self.targets]
+
+    def add_move(self, player, move):
+        """
+        Try to add <player>'s <move>.
+
+        If the move is legal, the board state is updated; if it's not legal, a
+        ValueError is raised.
+
+        Returns the number of tiles placed on the board.
+        """
+        mask = self.move_mask(move)
+        if mask is None or not self._check_mask_valid(player, move.piece_index, mask):
+            raise ValueError("Move is not allowed")
+
+        self.available[player] &= ~(1 << move.piece_index)  # mark piece as used
+        self._distance_maps = {}
+        self._previous_reachable = self._reachable
+        self._reachable = {}
+        self.tiles[player] |= mask
+        self.occupied |= mask
+
+        # Nobody can play on these squares
+        for p in range(self.num_players):
+            self.blocked[p] |= mask
+
+        # This player can't play next to them, and their diagonals are now attached
+        placement_id = self._get_placement_id(move)
+        if placement_id is not None:
+            self.blocked[player] |= self.placements.edges[placement_id]
+            self.corners[player] |= self.placements.corners[placement_id]
+        else:
+            self.blocked[player] |= self.edge_neighbours(mask)
+            self.corners[player] |= self.corner_neighbours(mask)
+
+        # Only the new tiles can get closer to the targets
+        for i, (ty, tx) in enumerate(self.targets):
+            for (xi, yi) in move.orientation:
+                dist = max(abs(ty - yi - move.y), abs(tx - xi - move.x))
+                if dist < self.target_dists[i]:
+                    self.target_dists[i] = dist
+
+        self.last_move = move
+        self.zobrist_key ^= self.zobrist.get_move_key(player, move)
+        num_tiles = move.piece.get_num_tiles()
+        self.scores[player] += num_tiles
+        return num_tiles
+
+    def do_move(self, player, move):
+        """
+        Performs a move, returning a new board
+        """
+        new_board = self.__copy__()
+        new_board.add_move(player, move)
+
+        return new_board
+
+    def make_move(self, player, move):
+        """
+        Performs a move in place, returning an undo record for undo_move.
+        """
+        undo = (player, self.occupied, self.tiles[player], self.blocked[:], self.corners[player],
+                self.available[player], self.scores[player], self.target_dists[:], self.last_move,
+                self.zobrist_key, self._reachable, self._previous_reachable)
+        self.add_move(player, move)
+        return undo
+
+    def undo_move(self, undo):
+        """
+        Takes back the move recorded in <undo> (returned by make_move).
+        """
+        (player, self.occupied, self.tiles[player], self.blocked, self.corners[player],
+         self.available[player], self.scores[player], self.target_dists, self.last_move,
+         self.zobrist_key, self._reachable, self._previous_reachable) = undo
+        self._distance_maps = {}
+
+    def get_legal_moves(self, player):
+        """
+        Returns a list of legal moves for given player for this board state
+
+        Like Board.get_legal_moves, only placements anchored on the player's
+        attachment points are tried.
+        """
+        table = self.placements
+        available = self.available[player]
+        blocked = self.blocked[player]
+        first_move = self.scores[player] == 0
+
+        move_list = []
+        for placement_id in table.get_candidates(self.get_frontier(player), first_move):
+            if available >> table.piece_index[placement_id] & 1 and not table.cells[placement_id] & blocked:
+                move_list.append(table.get_move(placement_id))
+        return move_list
+
+    def get_random_move(self, player, rng, tries=16):
+        """
+        Returns a random legal move for <player>, or None if they have none,
+        drawing from the random.Random <rng>. Meant for fast playouts.
+
+        A move is drawn by picking one of the player's attachment points, then
+        a placement anchored there, until a legal one comes up (so moves on
+        crowded attachment points are a bit more likely than others). After
+        <tries> misses, it's picked uniformly among the legal placements
+        instead.
+        """
+        frontier = self.get_frontier(player)
+        if not frontier:
+            return None
+        table = self.placements
+        available = self.available[player]
+        blocked = self.blocked[player]
+        first_move = self.scores[player] == 0
+        index = table.by_cell if first_move else table.by_anchor
+        for _ in range(tries):
+            (x, y) = frontier[rng.randrange(len(frontier))]
+            anchored = index[y * self.board_w + x]
+            if not anchored:
+                continue  # no placement fits there
+            placement_id = anchored[rng.randrange(len(anchored))]
+            if available >> table.piece_index[placement_id] & 1 and not table.cells[placement_id] & blocked:
+                return table.get_move(placement_id)
+
+        legal = [placement_id for placement_id in table.get_candidates(frontier, first_move)
+                 if available >> table.piece_index[placement_id] & 1 and not table.cells[placement_id] & blocked]
+        return table.get_move(legal[rng.randrange(len(legal))]) if legal else None
+
+    def get_legal_placements(self, player, pieces=None):
+        """
+        Returns every legal placement of <pieces> as a PLACEMENT_DTYPE array.
+
+        See Board.get_legal_placements.
+        """
+        if pieces is not None:
+            pieces = set([pieces] if np.isscalar(pieces) else pieces)
+
+        table = self.placements
+        found = [(table.piece_index[i], table.orientation[i], table.x[i], table.y[i])
+                 for i in (move.placement_id for move in self.get_legal_moves(player))
+                 if pieces is None or table.piece_index[i] in pieces]
+        return np.array(found, PLACEMENT_DTYPE)
+
+    def get_placement_move(self, placement):
+        """
+        Returns the Move described by a row of get_legal_placements
+        """
+        piece_index = int(placement['piece'])
+        ori = self.placements.orientations[piece_index][int(placement['orientation'])]
+        return Move(self.piece_list.get_piece(piece_index), piece_index, ori, int(placement['x']), int(placement['y']))
+
+    def get_frontier(self, player):
+        """
+        Returns the (x, y) cells <player> can currently attach a piece to
+        """
+        frontier = self.corners[player] & ~self.blocked[player]
+        cells = []
+        while frontier:
+            low_bit = frontier & -frontier
+            index = low_bit.bit_length() - 1
+            cells.append((index % self.board_w, index // self.board_w))
+            frontier ^= low_bit
+        return cells
+
+    def check_move_valid(self, player, move):
+        """
+        Check if <player> can legally perform <move>.
+
+        See Board.check_move_valid for the rules.
+        """
+        mask = self.move_mask(move)
+        return mask is not None and self._check_mask_valid(player, move.piece_index, mask)
+
+    def _check_mask_valid(self, player, piece_index, mask):
+        return (self.available[player] >> piece_index & 1 and
+                not mask & self.blocked[player] and
+                mask & self.corners[player] != 0)
+
+    def check_tile_legal(self, player, x, y):
+        """
+        Check if it's legal for <player> to place one tile at (<x>, <y>).
+        """
+        if x < 0 or x >= self.board_w or y < 0 or y >= self.board_h:
+            return False
+        return not self.blocked[player] & self._bit(x, y)
+
+    def check_tile_attached(self, player, x, y):
+        """
+        Check if (<x>, <y>) is diagonally attached to <player>'s moves.
+        """
+        if x < 0 or x >= self.board_w or y < 0 or y >= self.board_h:
+            return False
+        return self.corners[player] & self._bit(x, y) != 0
+
+    def get_position(self, x, y):
+        bit = self._bit(x, y)
+        if not self.occupied & bit:
+            return -1
+        for p in range(self.num_players):
+            if self.tiles[p] & bit:
+                return p
+
+    def get_distance_map(self, player=None):
+        """
+        Returns an array of the Chebyshev distance from each cell to the
+        nearest tile of <player> (any player if None). See Board.get_distance_map.
+        """
+        if player not in self._distance_maps:
+            occupied = self.state != -1 if player is None else self.state == player
+            self._distance_maps[player] = chebyshev_distance_map(occupied)
+        return self._distance_maps[player]
+
+    def get_reachable(self, player):
+        """
+        Returns a 2D boolean array of the cells <player> may still cover. See
+        Board.get_reachable.
+        """
+        if player not in self._reachable and player in self._previous_reachable:
+            reachable = self._update_reachable(player, self._previous_reachable[player])
+            if reachable is not None:
+                self._reachable[player] = reachable
+        if player not in self._reachable:
+            legal = self.full_mask & ~self.blocked[player]
+            reachable = self.corners[player] & legal
+            while True:
+                grown = (reachable | self.edge_neighbours(reachable) | self.corner_neighbours(reachable)) & legal
+                if grown == reachable:
+                    break
+                reachable = grown
+            self._reachable[player] = reachable
+        return self._layer_to_array(self._reachable[player])
+
+    def _update_reachable(self, player, reachable):
+        """
+        Returns the layer of the cells <player> may still cover now that
+        last_move was added, given the layer <reachable> before it, or None if
+        it must be computed again. See Board._update_reachable.
+        """
+        legal = self.full_mask & ~self.blocked[player]
+        lost = reachable & ~legal
+        if not lost:
+            return reachable
+        reachable &= legal
+        around = (lost | self.edge_neighbours(lost) | self.corner_neighbours(lost)) & reachable
+        if not around & self.corners[player]:
+            return None
+        connected = around & -around
+        while True:
+            grown = (connected | self.edge_neighbours(connected) | self.corner_neighbours(connected)) & around
+            if grown == connected:
+                break
+            connected = grown
+        return reachable if connected == around else None
+
+    def to_bytes(self):
+        """
+        Returns a compact bytes form of the board. See Board.to_bytes.
+        """
+        last_move = -1 if self.last_move is None or self.last_move.placement_id is None else self.last_move.placement_id
+        layer_bytes = (self.board_w * self.board_h + 7) // 8
+        piece_bytes = (self.piece_list.get_num_pieces() + 7) // 8
+        return b''.join([tiles.to_bytes(layer_bytes, 'little') for tiles in self.tiles] +
+                        [available.to_bytes(piece_bytes, 'little') for available in self.available] +
+                        [last_move.to_bytes(4, 'little', signed=True)])
+
+    def from_bytes(self, data):
+        """
+        Returns the board described by <data> (returned by to_bytes). See
+        Board.from_bytes.
+        """
+        layer_bytes = (self.board_w * self.board_h + 7) // 8
+        piece_bytes = (self.piece_list.get_num_pieces() + 7) // 8
+        board = self.__copy__()
+        offset = 0
+        for p in range(self.num_players):
+            board.tiles[p] = int.from_bytes(data[offset:offset + layer_bytes], 'little')
+            offset += layer_bytes
+        for p in range(self.num_players):
+            board.available[p] = int.from_bytes(data[offset:offset + piece_bytes], 'little')
+            offset += piece_bytes
+        last_move = int.from_bytes(data[offset:offset + 4], 'little', signed=True)
+        board.last_move = None if last_move == -1 else self.placements.get_move(last_move)
+
+        board.occupied = 0
+        for tiles in board.tiles:
+            board.occupied |= tiles
+        for p in range(self.num_players):
+            board.scores[p] = board.tiles[p].bit_count()
+            board.blocked[p] = board.occupied | self.edge_neighbours(board.tiles[p])
+            board.corners[p] |= self.corner_neighbours(board.tiles[p])
+        board._distance_maps = {}
+        board._reachable = {}
+        board._previous_reachable = {}
+        board.zobrist_key = self.zobrist.get_key(board)
+        if board.targets:
+            board.track_targets(board.targets)
+        return board
+
+    @staticmethod
+    def from_board(board):
+        """
+        Returns a BitBoard with the same state as <board> (a Board or a
+        BitBoard), e.g. to play fast simulations from a Board position.
+        """
+        if isinstance(board, BitBoard):
+            return board.__copy__()
+        bitboard = BitBoard(board.board_w, board.board_h, board.num_players, board.piece_list)
+        for p in range(board.num_players):
+            bitboard.tiles[p] = bitboard._array_to_layer(board.state == p)
+            bitboard.occupied |= bitboard.tiles[p]
+            bitboard.blocked[p] = bitboard._array_to_layer(~board._legal[p])
+            bitboard.corners[p] = bitboard._array_to_layer(board.connected[p])
+            bitboard.available[p] = sum(1 << i for i in np.flatnonzero(board.pieces[p]).tolist())
+            bitboard.scores[p] = board.scores[p]
+        bitboard.last_move = board.last_move
+        bitboard.zobrist_key = board.zobrist_key
+        if board.targets:
+            bitboard.track_targets(board.targets)
+        return bitboard
+
+    def __getstate__(self):
+        # The placement and Zobrist tables and cached arrays are rebuilt after unpickling
+        state = self.__dict__.copy()
+        del state['placements']
+        del state['zobrist']
+        state['_distance_maps'] = {}
+        state['_reachable'] = {}
+        state['_previous_reachable'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.placements = get_placement_table(self.piece_list, self.board_w, self.board_h)
+        self.zobrist = zobrist.get_zobrist_table(self.num_players, self.piece_list, self.board_w, self.board_h)
+
+    def score(self, player):
+        return self.scores[player]
+
+    def _layer_to_array(self, mask):
+        num_cells = self.board_w * self.board_h
+        bits = np.unpackbits(np.frombuffer(mask.to_bytes((num_cells + 7) // 8, 'little'), np.uint8),
+                             count=num_cells, bitorder='little')
+        return bits.astype(np.bool_).reshape((self.board_h, self.board_w))
+
+    def _array_to_layer(self, array):
+        bits = np.packbits(array.ravel(), bitorder='little')
+        return int.from_bytes(bits.tobytes(), 'little')
+
+    @property
+    def state(self):
+        """
+        The board state as a Board-style 2D array (-1 = free; 0-3 = player x's tile)
+        """
+        state = np.full((self.board_h, self.board_w), -1, np.int8)
+        for p in range(self.num_players):
+            state[self._layer_to_array(self.tiles[p])] = p
+        return state
+
+    @property
+    def pieces(self):
+        """
+        A Board-style num_players x num_pieces array; True iff the piece is unused
+        """
+        num_pieces = self.piece_list.get_num_pieces()
+        return np.array([[bool(available >> i & 1) for i in range(num_pieces)]
+                         for available in self.available], np.bool_)
+
+    @property
+    def _legal(self):
+        return np.array([~self._layer_to_array(blocked) for blocked in self.blocked])
+
+    @property
+    def connected(self):
+        return np.array([self._layer_to_array(corners) for corners in self.corners])
+
+    def key(self, symmetry=IDENTITY):
+        """
+        Returns an immutable snapshot of the board (its tiles and remaining pieces),
+        or of its image by <symmetry>. See Board.key.
+        """
+        if symmetry == IDENTITY:
+            return tuple(self.tiles), tuple(self.available)
+        return (tuple(self._array_to_layer(transform_array(self._layer_to_array(tiles), symmetry))
+                      for tiles in self.tiles), tuple(self.available))
+
+    def __eq__(self, other):
+        if self.zobrist_key != other.zobrist_key:
+            return False
+        if ((self.board_w, self.board_h) == (other.board_w, other.board_h) and
+                self.tiles == other.tiles and self.available == other.available):
+            return True
+        zobrist.collisions += 1
+        return False
+
+    def __hash__(self):
+        return self.zobrist_key
+
+    def __str__(self):
+        out_str = []
+        for row in range(self.board_h):
+            for col in range(self.board_w):
+                position = self.get_position(row, col)
+                if position == -1:
+                    out_str.append('_')
+                else:
+                    out_str.append(str(position))
+            out_str.append('\n')
+        return ''.join(out_str)
+
+    def __copy__(self):
+        cpy_board = BitBoard.__new__(BitBoard)
+        cpy_board.__dict__.update(self.__dict__)
+        cpy_board.scores = self.scores[:]
+        cpy_board.tiles = self.tiles[:]
+        cpy_board.blocked = self.blocked[:]
+        cpy_board.corners = self.corners[:]
+        cpy_board.available = self.available[:]
+        cpy_board.target_dists = self.target_dists[:]
+        cpy_board._distance_maps = dict(self._distance_maps)
+        cpy_board._reachable = dict(self._reachable)
+        return cpy_board
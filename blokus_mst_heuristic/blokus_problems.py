@@ -1,4 +1,5 @@
 import math
+import functools
 
 from board import Board
 from search import SearchProblem, ucs
@@ -6,6 +7,9 @@ import util
 import numpy as np
 import heapq
 
+# Number of target subsets whose MST weight each problem remembers
+MST_CACHE_SIZE = 4096
+
 class BlokusFillProblem(SearchProblem):
     """
     A one-player Blokus game as a search problem.
@@ -61,6 +65,8 @@ class BlokusCornersProblem(SearchProblem):
         self.expanded = 0
         "*** YOUR CODE HERE ***"
         self.board = Board(board_w, board_h, 1, piece_list, starting_point)
+        self.targets = [(0, 0), (board_h - 1, 0), (0, board_w - 1), (board_h - 1, board_w - 1)]
+        self.target_mst = TargetsMST(self.targets)
 
     def get_start_state(self):
         """
@@ -112,8 +118,7 @@ def blokus_corners_heuristic(state, problem):
     your heuristic is *not* consistent, and probably not admissible!  On the other hand,
     inadmissible or inconsistent heuristics may find optimal solutions, so be careful.
     """
-    targets = [(0, 0), (state.board_h - 1, 0), (0, state.board_w - 1), (state.board_h - 1, state.board_w - 1)]
-    return generic_heuristic(state, problem, targets)
+    return generic_heuristic(state, problem, problem.targets)
 
 
 class BlokusCoverProblem(SearchProblem):
@@ -122,6 +127,7 @@ class BlokusCoverProblem(SearchProblem):
         self.expanded = 0
         "*** YOUR CODE HERE ***"
         self.board = Board(board_w, board_h, 1, piece_list, starting_point)
+        self.target_mst = TargetsMST(self.targets)
 
     def get_start_state(self):
         """
@@ -170,37 +176,60 @@ def generic_heuristic(state, problem, targets):
     """
     The heuristic finds the minimal amount of steps to cover all targets by finding the minimum spanning tree
     between all targets on the board and adding the distance from the closest target to an already occupied tile.
+    <targets> must be the targets of problem.target_mst.
     """
-    uncovered_targets = find_uncovers_targets(state, targets)
+    uncovered = frozenset(i for i, target in enumerate(targets) if state.get_position(target[1], target[0]) == -1)
 
-    if not uncovered_targets:
+    if not uncovered:
         return 0  # All targets are covered
 
-    # Get all occupied tiles on the board
-    occupied_tiles = find_occupied_tiles(state)
-    min_dist = float('inf')
+    # Find the closest uncovered target to an occupied tile, using the board's
+    # distance map (see Board.get_distance_map)
+    dist_map = state.get_distance_map()
+    min_dist = min(dist_map[targets[i][0], targets[i][1]] for i in uncovered).item()
 
-    # Find the closest uncovered target to an occupied tile
-    for tile in occupied_tiles:
-        for target in uncovered_targets:
-            cur_dist = chebyshev_distance(tile, target)
-            if cur_dist < min_dist:
-                min_dist = cur_dist
-
-    # Find the minimum spanning tree of the uncovered targets
-    mst_len = find_mst(uncovered_targets)
+    # Find the minimum spanning tree of the uncovered targets (memoized per subset)
+    mst_len = problem.target_mst.weight(uncovered)
 
     return min_dist + mst_len
 
 # Helper functions:
 
-def find_mst(positions):
+class TargetsMST:
+    """
+    Minimum spanning tree weights of subsets of a fixed list of targets.
+
+    The pairwise Chebyshev distances are computed once, and since the uncovered
+    targets form one of few subsets, the weight of each subset (a frozenset of
+    target indices) is memoized in a bounded LRU cache.
+    """
+
+    def __init__(self, targets, cache_size=MST_CACHE_SIZE):
+        self.targets = list(targets)
+        self.distances = [[chebyshev_distance(u, v) for v in self.targets] for u in self.targets]
+        self.weight = functools.lru_cache(maxsize=cache_size)(self.find_mst)
+
+    def find_mst(self, indices):
+        """
+        Find the minimum spanning tree weight of the targets at <indices> using Prim's algorithm.
+        """
+        return find_mst(sorted(indices), self.distances)
+
+
+def find_mst(positions, distances=None):
     """
     Find the minimum spanning tree weight for the given positions using Prim's algorithm.
+    If <distances> is given, positions are indices into that distance matrix.
     """
     if not positions:
         return 0
 
+    if distances is None:
+        distance = chebyshev_distance
+    else:
+        def distance(u, v):
+            return distances[u][v]
+
     start = positions[0]
     visited = set()
     total_weight = 0
@@ -214,7 +243,7 @@ def find_mst(positions):
         total_weight += cost
         for v in positions:
             if v not in visited:
-                heapq.heappush(min_heap, (chebyshev_distance(u, v), v))
+                heapq.heappush(min_heap, (distance(u, v), v))
 
     return total_weight
 
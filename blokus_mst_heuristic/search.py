@@ -50,8 +50,7 @@ class SearchProblem:
 
 
 def tree_search(problem, fringe):
-    fringe = fringe
-    visited = []
+    visited = set()  # keys of the expanded states
     fringe.push((problem.get_start_state(), []))
 
     while not fringe.isEmpty():
@@ -60,13 +59,26 @@ def tree_search(problem, fringe):
         if problem.is_goal_state(state):
             return actions
 
-        if state not in visited:
-            visited.append(state)
+        key = get_state_key(state)
+        if key not in visited:
+            visited.add(key)
             for successor, action, cost in problem.get_successors(state):
                 fringe.push((successor, actions + [action]))
 
     return []  # no solution
 
+def get_state_key(state):
+    """
+    Returns a compact, hashable key identifying <state> for closed sets:
+    state.key() if the state provides one (e.g. boards), otherwise the state
+    itself.
+    """
+    key = getattr(state, 'key', None)
+    if key is None:
+        return state
+    return key()
+
+
 def depth_first_search(problem):
     """
     Search the deepest nodes in the search tree first.
@@ -82,7 +94,7 @@ def depth_first_search(problem):
     print("Start's successors:", problem.getSuccessors(problem.getStartState()))
     """
     stack = util.Stack()
-    return tree_search(stack)
+    return tree_search(problem, stack)
     # visited = []
     # stack.push((problem.get_start_state(), []))
     #
@@ -106,7 +118,7 @@ def breadth_first_search(problem):
     """
     "*** YOUR CODE HERE ***"
     queue = util.Queue()
-    return tree_search(queue)
+    return tree_search(problem, queue)
     # visited = []
     # queue.push((problem.get_start_state(), []))
     #
@@ -166,7 +178,7 @@ def a_star_search(problem, heuristic=null_heuristic):
     start_node = Node(start_state, [], None, 0, heuristic(start_state, problem))
     queue.push(start_node, start_node.f)  # node, cost
 
-    visited = dict()  # Maps state to the cost to reach that state
+    visited = dict()  # Maps state keys to the cost to reach that state
 
     while not queue.isEmpty():
         node = queue.pop()
@@ -175,10 +187,11 @@ def a_star_search(problem, heuristic=null_heuristic):
             return node.actions
 
         # Check if this node has been visited with a lower cost
-        if node.state in visited and visited[node.state] <= node.cost:
+        key = get_state_key(node.state)
+        if key in visited and visited[key] <= node.cost:
             continue
 
-        visited[node.state] = node.cost
+        visited[key] = node.cost
 
         for successor, action, cost in problem.get_successors(node.state):
             cost_so_far = cost + node.cost
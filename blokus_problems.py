@@ -1,20 +1,99 @@
 import math
+import time
 
-from board import Board
-from search import SearchProblem, ucs
+from board import Board, IDENTITY, get_symmetries
+from search import SearchProblem, anytime_repairing_a_star_search, get_canonical_key, ucs, weighted_a_star_search
 import util
 import numpy as np
 
 
-class BlokusFillProblem(SearchProblem):
+class BlokusProblem(SearchProblem):
+    """
+    The successor functions shared by the one-player Blokus search problems: the successors of a
+    board are the moves of player 0 given by get_legal_moves, each costing get_step_cost.
+    Subclasses set board, expanded, lazy_successors and symmetries. Their lazy argument is off by
+    default: lazy successors (see SearchProblem) build fewer boards, but can change the order in
+    which ties are expanded, and so the number of expanded nodes
+    """
+
+    def get_successors(self, state):
+        """
+        state: Search state
+
+        For a given state, this should return a list of triples,
+        (successor, action, stepCost), where 'successor' is a
+        successor to the current state, 'action' is the action
+        required to get there, and 'stepCost' is the incremental
+        cost of expanding to that successor
+        """
+        # Note that for the search problem, there is only one player - #0
+        self.expanded = self.expanded + 1
+        return [(state.do_move(0, move), move, self.get_step_cost(move)) for move in self.get_legal_moves(state)]
+
+    def get_successor_moves(self, state):
+        """
+        state: Search state
+
+        Returns the (action, stepCost) pairs of the successors of state, without
+        building the successor boards
+        """
+        self.expanded = self.expanded + 1
+        return [(move, self.get_step_cost(move)) for move in self.get_legal_moves(state)]
+
+    def get_legal_moves(self, state):
+        """
+        state: Search state
+
+        Returns the moves leading to the successors of state
+        """
+        return state.get_legal_moves(0)
+
+    def get_step_cost(self, action):
+        """
+        Returns the cost of placing action: the number of its tiles
+        """
+        return action.piece.get_num_tiles()
+
+    def get_successor(self, state, action):
+        """
+        Returns the board reached by placing action on state
+        """
+        return state.do_move(0, action)
+
+    def make_move(self, state, action):
+        """
+        Places action on state in place, returning an undo record for undo_move
+        """
+        return state.make_move(0, action)
+
+    def undo_move(self, state, undo):
+        """
+        Takes back the move recorded in undo
+        """
+        state.undo_move(undo)
+
+    def get_state_key(self, state):
+        """
+        Returns the key of state, shared by its images by the symmetries of the problem
+        """
+        return get_canonical_key(state, self.symmetries)
+
+
+class BlokusFillProblem(BlokusProblem):
     """
     A one-player Blokus game as a search problem.
     This problem is implemented for you. You should NOT change it!
     """
 
-    def __init__(self, board_w, board_h, piece_list, starting_point=(0, 0)):
-        self.board = Board(board_w, board_h, 1, piece_list, starting_point)
+    def __init__(self, board_w, board_h, piece_list, starting_point=(0, 0), board_class=Board, lazy=False,
+                 symmetric=True, partial_order=False):
+        self.board = board_class(board_w, board_h, 1, piece_list, starting_point)
         self.expanded = 0
+        self.lazy_successors = lazy
+        self.symmetries = get_symmetries(board_w, board_h, starting_point) if symmetric else [IDENTITY]
+        self.partial_order = partial_order
+        # The moves generated from a board depend on its last move
+        self.path_dependent_successors = partial_order
 
     def get_start_state(self):
         """
@@ -29,19 +108,23 @@ class BlokusFillProblem(SearchProblem):
         """
         return not any(state.pieces[0])
 
-    def get_successors(self, state):
+    def get_legal_moves(self, state):
         """
         state: Search state
 
-        For a given state, this should return a list of triples,
-        (successor, action, stepCost), where 'successor' is a
-        successor to the current state, 'action' is the action
-        required to get there, and 'stepCost' is the incremental
-        cost of expanding to that successor
+        Returns the legal moves from state. With partial_order set, moves that are independent of the
+        last move and could have been played before it are left out (see get_partial_order_moves)
         """
-        # Note that for the search problem, there is only one player - #0
-        self.expanded = self.expanded + 1
-        return [(state.do_move(0, move), move, 1) for move in state.get_legal_moves(0)]
+        moves = state.get_legal_moves(0)
+        if self.partial_order:
+            moves = get_partial_order_moves(state, moves)
+        return moves
+
+    def get_step_cost(self, action):
+        """
+        Returns the cost of placing action: every move costs 1
+        """
+        return 1
 
     def get_cost_of_actions(self, actions):
         """
@@ -53,14 +136,36 @@ class BlokusFillProblem(SearchProblem):
         return len(actions)
 
 
+def get_partial_order_moves(state, moves):
+    """
+    Leave out of moves the ones that don't touch the last move on state (no shared edge or
+    corner) and use a lower piece index.
+
+    Such a move b is independent of the last move a: playing b then a is legal and reaches
+    the same board, so only the order with increasing piece indices needs to be searched.
+    The moves kept depend on the last move (see SearchProblem.path_dependent_successors)
+    """
+    last_move = state.last_move
+    if last_move is None or last_move.placement_id is None:
+        return moves
+    table = state.placements
+    return [move for move in moves
+            if move.piece_index > last_move.piece_index or table.touches(last_move.placement_id, move.placement_id)]
+
+
 #####################################################
 # This portion is incomplete.  Time to write code!  #
 #####################################################
-class BlokusCornersProblem(SearchProblem):
-    def __init__(self, board_w, board_h, piece_list, starting_point=(0, 0)):
+class BlokusCornersProblem(BlokusProblem):
+    def __init__(self, board_w, board_h, piece_list, starting_point=(0, 0), board_class=Board, lazy=False,
+                 symmetric=True):
         self.expanded = 0
         "*** YOUR CODE HERE ***"
-        self.board = Board(board_w, board_h, 1, piece_list, starting_point)
+        self.board = board_class(board_w, board_h, 1, piece_list, starting_point)
+        self.lazy_successors = lazy
+        self.corners = [(0, 0), (0, board_w - 1), (board_h - 1, 0), (board_h - 1, board_w - 1)]  # (h, w) / (y,x)
+        self.board.track_targets(self.corners)
+        self.symmetries = get_symmetries(board_w, board_h, starting_point, self.corners) if symmetric else [IDENTITY]
 
     def get_start_state(self):
         """
@@ -75,19 +180,15 @@ class BlokusCornersProblem(SearchProblem):
         return ((state.get_position(w, h) > -1) and (state.get_position(0, h) > -1) and
                 (state.get_position(w, 0) > -1) and (state.get_position(0, 0) > -1))
 
-    def get_successors(self, state):
+    def get_legal_moves(self, state):
         """
         state: Search state
 
-        For a given state, this should return a list of triples,
-        (successor, action, stepCost), where 'successor' is a
-        successor to the current state, 'action' is the action
-        required to get there, and 'stepCost' is the incremental
-        cost of expanding to that successor
+        Returns the legal moves from state, or none once some target can't be covered anymore
         """
-        # Note that for the search problem, there is only one player - #0
-        self.expanded = self.expanded + 1
-        return [(state.do_move(0, move), move, move.piece.get_num_tiles()) for move in state.get_legal_moves(0)]
+        if has_dead_target(state, self.corners):
+            return []  # no goal state can be reached from here
+        return state.get_legal_moves(0)
 
     def get_cost_of_actions(self, actions):
         """
@@ -112,57 +213,75 @@ def blokus_corners_heuristic(state, problem):
     your heuristic is *not* consistent, and probably not admissible!  On the other hand,
     inadmissible or inconsistent heuristics may find optimal solutions, so be careful.
     """
-    # number of uncovered targets:
-    bottom_left = (0, 0)
-    bottom_right = (0, state.board_w - 1)
-    top_left = (state.board_h - 1, 0)
-    top_right = (state.board_h - 1, state.board_w - 1)
-    corners = [top_left, top_right, bottom_right, bottom_left]  # (h, w) / (y,x)
+    if has_dead_target(state, problem.corners):
+        return float('inf')  # some target can't be covered anymore
 
-    uncovered = 0
-    for corner in corners:
-        if state.get_position(corner[1], corner[0]) == -1:
-            uncovered += 1
+    dists = get_target_dists(state, problem.corners)
+
+    # number of uncovered targets:
+    uncovered = sum(1 for dist in dists if dist > 0)
 
     # distance from the farthest target:
-    max_dist = 0
-    for corner in corners:
-        dist = find_min_dist(state, corner)  # Find the minimum distance to the corner
-        if dist == float('inf'):
-            return float('inf')
-        if dist > max_dist:
-            max_dist = dist
+    max_dist = max(dists)
+    if max_dist == float('inf'):
+        return float('inf')
 
     if uncovered == 0 and max_dist == 0:
         return 0
 
     return uncovered + max_dist - 1
 
-def find_min_dist(state, target):
+
+def get_target_dists(state, targets):
     """
-    Find the minimum distance between an occupied tile on the board to the given target
+    Find the minimum distance between an occupied tile on the board and each of the given targets.
+    Boards tracking these targets (see Board.track_targets) already maintain them incrementally
     """
-    if state.get_position(target[1], target[0]) > -1:   # if target is occupied distance is 0
-        return 0
+    if state.targets == tuple(targets):
+        return state.target_dists
+    return [find_min_dist(state, target) for target in targets]
 
-    min_dist = float('inf')
-
-    for h in range(state.board_h):
-        for w in range(state.board_w):
-            if state.get_position(w, h) == -1:
-                continue  # if tile is not occupied
-            dist = max(abs(w - target[1]), abs(h - target[0]))  # chebyshev distance
-            if dist < min_dist:
-                min_dist = dist
+def has_dead_target(state, targets):
+    """
+    Check if one of the uncovered targets can no longer be covered by player 0: it is
+    illegal for them (occupied or next to their own tiles) or out of their reachable
+    region (see Board.get_reachable). No goal state can be reached from such a state
+    """
+    reachable = None
+    for (ty, tx) in targets:
+        if state.get_position(tx, ty) == -1:
+            if not state.check_tile_legal(0, tx, ty):
+                return True
+            if reachable is None:
+                reachable = state.get_reachable(0)
+            if not reachable[ty, tx]:
+                return True
+    return False
 
-    return min_dist
+def find_min_dist(state, target):
+    """
+    Find the minimum distance between an occupied tile on the board to the given target
+    The board's distance map (see Board.get_distance_map) answers this for every cell at once
+    """
+    return state.get_distance_map()[target[0], target[1]].item()
 
-class BlokusCoverProblem(SearchProblem):
-    def __init__(self, board_w, board_h, piece_list, starting_point=(0, 0), targets=[(0, 0)]):
+class BlokusCoverProblem(BlokusProblem):
+    def __init__(self, board_w, board_h, piece_list, starting_point=(0, 0), targets=[(0, 0)], board_class=Board,
+                 lazy=False, symmetric=True, board=None):
+        """
+        board: a board to start from instead of an empty one (it is copied)
+        """
         self.targets = targets.copy()
         self.expanded = 0
         "*** YOUR CODE HERE ***"
-        self.board = Board(board_w, board_h, 1, piece_list, starting_point)
+        if board is None:
+            self.board = board_class(board_w, board_h, 1, piece_list, starting_point)
+        else:
+            self.board = board.__copy__()
+            symmetric = False  # the symmetries are those of an empty board
+        self.lazy_successors = lazy
+        self.board.track_targets(self.targets)
+        self.symmetries = get_symmetries(board_w, board_h, starting_point, self.targets) if symmetric else [IDENTITY]
 
     def get_start_state(self):
         """
@@ -177,19 +296,15 @@ class BlokusCoverProblem(SearchProblem):
                 return False
         return True
 
-    def get_successors(self, state):
+    def get_legal_moves(self, state):
         """
         state: Search state
 
-        For a given state, this should return a list of triples,
-        (successor, action, stepCost), where 'successor' is a
-        successor to the current state, 'action' is the action
-        required to get there, and 'stepCost' is the incremental
-        cost of expanding to that successor
+        Returns the legal moves from state, or none once some target can't be covered anymore
         """
-        # Note that for the search problem, there is only one player - #0
-        self.expanded = self.expanded + 1
-        return [(state.do_move(0, move), move, move.piece.get_num_tiles()) for move in state.get_legal_moves(0)]
+        if has_dead_target(state, self.targets):
+            return []  # no goal state can be reached from here
+        return state.get_legal_moves(0)
 
     def get_cost_of_actions(self, actions):
         """
@@ -204,22 +319,136 @@ class BlokusCoverProblem(SearchProblem):
 
 def blokus_cover_heuristic(state, problem):
     "*** YOUR CODE HERE ***"
-    # number of uncovered targets:
-    uncovered = 0
+    if has_dead_target(state, problem.targets):
+        return float('inf')  # some target can't be covered anymore
 
-    for target in problem.targets:
-        if state.get_position(target[1], target[0]) == -1:
-            uncovered += 1
+    dists = get_target_dists(state, problem.targets)
+
+    # number of uncovered targets:
+    uncovered = sum(1 for dist in dists if dist > 0)
 
     # distance from the farthest target:
-    max_dist = 0
-    for target in problem.targets:
-        dist = find_min_dist(state, target)  # Find the minimum distance to the target
-        if dist == float('inf'):
-            return float('inf')
-        if dist > max_dist:
-            max_dist = dist
+    max_dist = max(dists)
 
     return max(max_dist, uncovered)
     # return max_dist
-    #return uncovered
\ No newline at end of file
+    #return uncovered
+
+
+def find_uncovered_targets(state, targets):
+    """
+    Returns the targets not covered on state
+    """
+    return [target for target in targets if state.get_position(target[1], target[0]) == -1]
+
+
+class ClosestLocationSearch:
+    """
+    In this problem you have to cover all given positions on the board,
+    but the objective is speed, not optimality.
+
+    The targets are covered one at a time, each time the uncovered target closest to the tiles
+    on the board, by weighted A* (see search.weighted_a_star_search) with the given weight
+    """
+
+    def __init__(self, board_w, board_h, piece_list, starting_point=(0, 0), targets=[(0, 0)], board_class=Board,
+                 weight=2):
+        self.expanded = 0
+        self.targets = targets.copy()
+        "*** YOUR CODE HERE ***"
+        self.board = board_class(board_w, board_h, 1, piece_list, starting_point)
+        self.starting_point = starting_point
+        self.weight = weight
+
+    def get_start_state(self):
+        """
+        Returns the start state for the search problem
+        """
+        return self.board
+
+    def get_target_distance(self, state, target):
+        """
+        Returns the distance from the tiles on state to target, or from the starting point if
+        there are none
+        """
+        dist = find_min_dist(state, target)
+        if dist == float('inf'):
+            dist = max(abs(target[0] - self.starting_point[0]), abs(target[1] - self.starting_point[1]))
+        return dist
+
+    def solve(self):
+        """
+        This method should return a sequence of actions that covers all target locations on the board.
+        This time we trade optimality for speed.
+        Therefore, your agent should try and cover one target location at a time. Each time, aiming for the closest uncovered location.
+
+        If some target can't be covered anymore, the actions covering the other ones are returned
+        """
+        "*** YOUR CODE HERE ***"
+        current_state = self.board.__copy__()
+        backtrace = []
+        uncovered = find_uncovered_targets(current_state, self.targets)
+
+        while uncovered:
+            target = min(uncovered, key=lambda t: self.get_target_distance(current_state, t))
+            problem = BlokusCoverProblem(current_state.board_w, current_state.board_h, current_state.piece_list,
+                                         self.starting_point, [target], board=current_state)
+            actions = weighted_a_star_search(problem, blokus_cover_heuristic, self.weight)
+            self.expanded += problem.expanded
+
+            if not actions:
+                uncovered.remove(target)  # not reachable anymore, go on with the others
+                continue
+            for action in actions:
+                current_state.add_move(0, action)
+            backtrace += actions
+            uncovered = [t for t in uncovered if current_state.get_position(t[1], t[0]) == -1]
+
+        return backtrace
+
+
+class MiniContestSearch:
+    """
+    Implement your contest entry here
+
+    Covers all the targets as cheaply as possible within time_limit seconds: ClosestLocationSearch
+    quickly finds a first solution, then anytime repairing A* (see
+    search.anytime_repairing_a_star_search) looks for cheaper ones until the time runs out
+    """
+
+    def __init__(self, board_w, board_h, piece_list, starting_point=(0, 0), targets=[(0, 0)], board_class=Board,
+                 time_limit=10):
+        self.targets = targets.copy()
+        self.expanded = 0
+        "*** YOUR CODE HERE ***"
+        self.board = board_class(board_w, board_h, 1, piece_list, starting_point)
+        self.starting_point = starting_point
+        self.time_limit = time_limit
+
+    def get_start_state(self):
+        """
+        Returns the start state for the search problem
+        """
+        return self.board
+
+    def solve(self):
+        "*** YOUR CODE HERE ***"
+        deadline = time.time() + self.time_limit
+        board = self.board
+
+        closest = ClosestLocationSearch(board.board_w, board.board_h, board.piece_list, self.starting_point,
+                                        self.targets, type(board))
+        backtrace = closest.solve()
+        self.expanded = closest.expanded
+
+        time_left = deadline - time.time()
+        if time_left > 0:
+            problem = BlokusCoverProblem(board.board_w, board.board_h, board.piece_list, self.starting_point,
+                                         self.targets, board=board)
+            actions = anytime_repairing_a_star_search(problem, blokus_cover_heuristic, time_left)
+            self.expanded += problem.expanded
+            if actions and (not backtrace or problem.get_cost_of_actions(actions) <
+                            problem.get_cost_of_actions(backtrace)):
+                backtrace = actions
+
+        return backtrace
@@ -1,5 +1,110 @@
 import numpy as np
 
+import placements
+import zobrist
+
+# A legal placement returned by Board.get_legal_placements. orientation indexes
+# the piece's orientations in iteration order (PlacementTable.orientations)
+PLACEMENT_DTYPE = np.dtype([('piece', np.int16), ('orientation', np.int8), ('x', np.int16), ('y', np.int16)])
+
+
+def chebyshev_distance_map(occupied):
+    """
+    Given a 2D boolean array, return an array holding, for every cell, the
+    Chebyshev distance to the nearest True cell (or an array of inf if there
+    are none).
+
+    The transform is separable: first the distance to the nearest True cell of
+    each row, d_row[y', x], then dist[y, x] = min over y' of
+    max(|y - y'|, d_row[y', x]). Both steps are single NumPy reductions.
+    """
+    (h, w) = occupied.shape
+    if not occupied.any():
+        return np.full((h, w), np.inf)
+
+    cols = np.arange(w)
+    dx = np.abs(cols[:, None] - cols[None, :])
+    # Rows without occupied cells get a distance larger than any real one
+    row_dist = np.where(occupied[:, None, :], dx[None, :, :], max(h, w)).min(axis=2)
+
+    rows = np.arange(h)
+    dy = np.abs(rows[:, None] - rows[None, :])
+    return np.maximum(dy[:, :, None], row_dist[None, :, :]).min(axis=1)
+
+
+# The symmetries of a board, as (transpose, flip_rows, flip_cols), applied in that
+# order. Transposing only maps square boards onto themselves
+SYMMETRIES = [(transpose, flip_rows, flip_cols)
+              for transpose in (False, True) for flip_rows in (False, True) for flip_cols in (False, True)]
+IDENTITY = SYMMETRIES[0]
+
+
+def transform_array(array, symmetry):
+    """
+    Return <array> (indexed [..., y, x]) transformed by <symmetry>, as a view.
+    """
+    (transpose, flip_rows, flip_cols) = symmetry
+    if transpose:
+        array = np.swapaxes(array, -1, -2)
+    if flip_rows:
+        array = array[..., ::-1, :]
+    if flip_cols:
+        array = array[..., ::-1]
+    return array
+
+
+def transform_cell(cell, symmetry, board_w, board_h):
+    """
+    Return the (row, column) cell <cell> is moved to by <symmetry>.
+    """
+    (row, col) = cell
+    (transpose, flip_rows, flip_cols) = symmetry
+    if transpose:
+        (row, col, board_w, board_h) = (col, row, board_h, board_w)
+    if flip_rows:
+        row = board_h - 1 - row
+    if flip_cols:
+        col = board_w - 1 - col
+    return (row, col)
+
+
+def get_symmetries(board_w, board_h, starting_point, targets=()):
+    """
+    Return the symmetries of a one-player <board_w> x <board_h> board that keep
+    the (row, column) <starting_point> in place and map the <targets> cells
+    onto themselves. Every piece can be rotated and flipped, so boards mapped
+    onto each other by such a symmetry are equivalent search states.
+    """
+    target_set = set(tuple(target) for target in targets)
+    return [symmetry for symmetry in SYMMETRIES
+            if (board_w == board_h or not symmetry[0]) and
+            transform_cell(starting_point, symmetry, board_w, board_h) == tuple(starting_point) and
+            set(transform_cell(target, symmetry, board_w, board_h) for target in target_set) == target_set]
+
+
+def _edge_neighbours(cells):
+    """
+    Given a 2D boolean array, return the cells sharing an edge with a True cell.
+    """
+    neighbours = np.zeros_like(cells)
+    neighbours[1:] |= cells[:-1]
+    neighbours[:-1] |= cells[1:]
+    neighbours[:, 1:] |= cells[:, :-1]
+    neighbours[:, :-1] |= cells[:, 1:]
+    return neighbours
+
+
+def _corner_neighbours(cells):
+    """
+    Given a 2D boolean array, return the cells sharing a corner with a True cell.
+    """
+    neighbours = np.zeros_like(cells)
+    neighbours[1:, 1:] |= cells[:-1, :-1]
+    neighbours[1:, :-1] |= cells[:-1, 1:]
+    neighbours[:-1, 1:] |= cells[1:, :-1]
+    neighbours[:-1, :-1] |= cells[1:, 1:]
+    return neighbours
+
 
 class Board:
 
@@ -15,8 +120,25 @@ class Board:
       on another player's piece or adjacent to a player's own piece
     - connected: a 4 x 2D array. _connected[player][y][x] is True iff (x,y) is
       diagonally connected to another one of the player's tiles
+    - frontier: a list of 4 sets. frontier[player] holds the (x,y) cells that
+      are both connected and legal for the player, i.e. the cells a new piece
+      can attach to. It is kept up to date by add_move
+    - targets/target_dists: the (row, column) cells registered with
+      track_targets, and the Chebyshev distance from each of them to the
+      nearest occupied tile (inf while the board is empty), kept up to date
+      by add_move
+    - last_move: the last move added to the board (None on a new board)
+    - _distance_maps/_reachable: the arrays computed by get_distance_map and
+      get_reachable for this board, dropped whenever the board changes.
+      _previous_reachable keeps those of the board before last_move, which
+      get_reachable updates when possible (see _update_reachable)
     - piece_list: A PieceList object (probably shared with the game engine) to
       help understand the moves
+    - placements: the PlacementTable of piece_list on this board size, shared
+      by every board of the same size
+    - zobrist_key: the Zobrist key of the tiles and used pieces, kept up to
+      date by add_move and used as the board's hash (see zobrist.py). Boards
+      are only compared in full once their keys match
     """
 
     def __init__(self, board_w, board_h, num_players, piece_list, starting_point=(0, 0)):
@@ -31,8 +153,36 @@ class Board:
 
         self.connected = np.full((num_players, board_h, board_w), False, np.bool_)
         self.connected[0, starting_point[0], starting_point[1]] = True
+        self.frontier = [set() for _ in range(num_players)]
+        self.frontier[0].add((starting_point[1], starting_point[0]))
+        self.targets = ()
+        self.target_dists = []
+        self.last_move = None
+        self._distance_maps = {}
+        self._reachable = {}
+        self._previous_reachable = {}
         self.piece_list = piece_list
         self.pieces = np.full((num_players, piece_list.get_num_pieces()), True, np.bool_)
+        self.placements = placements.get_placement_table(piece_list, board_w, board_h)
+        self.zobrist = zobrist.get_zobrist_table(num_players, piece_list, board_w, board_h)
+        self.zobrist_key = 0
+
+    def set_starting_point(self, player, starting_point):
+        """
+        Attach the cell <starting_point> (given as (row, column)) to <player>,
+        allowing their first piece to be placed there.
+        """
+        self.connected[player, starting_point[0], starting_point[1]] = True
+        if self._legal[player, starting_point[0], starting_point[1]]:
+            self.frontier[player].add((starting_point[1], starting_point[0]))
+
+    def track_targets(self, targets):
+        """
+        Start maintaining target_dists for the (row, column) cells <targets>.
+        """
+        self.targets = tuple(targets)
+        dist_map = self.get_distance_map()
+        self.target_dists = [dist_map[ty, tx].item() for (ty, tx) in self.targets]
 
     def add_move(self, player, move):
         """
@@ -48,6 +198,9 @@ class Board:
 
         piece = move.piece
         self.pieces[player, move.piece_index] = False  # mark piece as used
+        self._distance_maps = {}
+        self._previous_reachable = self._reachable
+        self._reachable = {}
 
         # Update internal state for each tile
         for (xi, yi) in move.orientation:
@@ -78,6 +231,27 @@ class Board:
             if x < self.board_w - 1 and y > 0:
                 self.connected[player, y - 1, x + 1] = True
 
+        # Refresh the frontiers around the new tiles
+        for (xi, yi) in move.orientation:
+            (x, y) = (xi + move.x, yi + move.y)
+            for p in range(self.num_players):
+                self.frontier[p].discard((x, y))
+            for ny in range(max(y - 1, 0), min(y + 2, self.board_h)):
+                for nx in range(max(x - 1, 0), min(x + 2, self.board_w)):
+                    if self.connected[player, ny, nx] and self._legal[player, ny, nx]:
+                        self.frontier[player].add((nx, ny))
+                    else:
+                        self.frontier[player].discard((nx, ny))
+
+        # Only the new tiles can get closer to the targets
+        for i, (ty, tx) in enumerate(self.targets):
+            for (xi, yi) in move.orientation:
+                dist = max(abs(ty - yi - move.y), abs(tx - xi - move.x))
+                if dist < self.target_dists[i]:
+                    self.target_dists[i] = dist
+
+        self.last_move = move
+        self.zobrist_key ^= self.zobrist.get_move_key(player, move)
         self.scores[player] += piece.get_num_tiles()
         return piece.get_num_tiles()
 
@@ -90,23 +264,127 @@ class Board:
 
         return new_board
 
+    def make_move(self, player, move):
+        """
+        Performs a move in place, returning an undo record for undo_move.
+
+        A move only changes the cells of its piece and their neighbours, so the
+        record holds copies of that window of the board instead of the whole
+        board. Raises ValueError if the move is illegal.
+        """
+        xs = [xi + move.x for (xi, yi) in move.orientation]
+        ys = [yi + move.y for (xi, yi) in move.orientation]
+        (x0, x1) = (max(min(xs) - 1, 0), min(max(xs) + 2, self.board_w))
+        (y0, y1) = (max(min(ys) - 1, 0), min(max(ys) + 2, self.board_h))
+
+        undo = (player, move, x0, x1, y0, y1,
+                self.state[y0:y1, x0:x1].copy(),
+                self._legal[:, y0:y1, x0:x1].copy(),
+                self.connected[player, y0:y1, x0:x1].copy(),
+                [[(x, y) for (x, y) in frontier if x0 <= x < x1 and y0 <= y < y1] for frontier in self.frontier],
+                self.target_dists[:], self.last_move, self.zobrist_key, self._reachable, self._previous_reachable)
+        self.add_move(player, move)
+        return undo
+
+    def undo_move(self, undo):
+        """
+        Takes back the move recorded in <undo> (returned by make_move). Moves
+        must be undone in the reverse order they were made.
+        """
+        (player, move, x0, x1, y0, y1, state, legal, connected, frontiers, self.target_dists,
+         self.last_move, self.zobrist_key, self._reachable, self._previous_reachable) = undo
+        self.state[y0:y1, x0:x1] = state
+        self._legal[:, y0:y1, x0:x1] = legal
+        self.connected[player, y0:y1, x0:x1] = connected
+        for (frontier, cells) in zip(self.frontier, frontiers):
+            frontier.difference_update([(x, y) for (x, y) in frontier if x0 <= x < x1 and y0 <= y < y1])
+            frontier.update(cells)
+        self.pieces[player, move.piece_index] = True
+        self.scores[player] -= move.piece.get_num_tiles()
+        self._distance_maps = {}
+
     def get_legal_moves(self, player):
         """
         Returns a list of legal moves for given player for this board state 
+
+        Every legal move covers one of the player's attachment points, so
+        instead of scanning the whole board we only try the placements that put
+        one of the piece's corner tiles on such a cell (see PlacementTable).
+        Moves are returned in (piece, x, y, orientation) order.
         """
-        # Generate all legal moves
+        table = self.placements
+        # Before the first move the attachment point is a bare starting cell,
+        # which any tile of the piece may cover
+        first_move = self.scores[player] == 0
+
         move_list = []
-        for piece in self.piece_list:
-            for x in range(self.board_w):
-                for y in range(self.board_h):
-                    for ori in piece:
-                        new_move = Move(piece,
-                                        self.piece_list.pieces.index(piece),
-                                        ori, x, y)
-                        if self.check_move_valid(player, new_move):
-                            move_list.append(new_move)
+        for placement_id in table.get_candidates(self.frontier[player], first_move):
+            if not self.pieces[player, table.piece_index[placement_id]]:
+                continue
+            move = table.get_move(placement_id)
+            if self.check_move_valid(player, move):
+                move_list.append(move)
         return move_list
 
+    def get_legal_placements(self, player, pieces=None):
+        """
+        Returns every legal placement of <pieces> (a piece index, a list of
+        indices, or None for all of the player's remaining pieces) as a
+        PLACEMENT_DTYPE array, in (piece, x, y, orientation) order.
+
+        Instead of checking tiles one by one, each orientation's footprint is
+        slid over the board: a placement is legal iff the _legal windows of all
+        its tiles are True and the connected window of at least one tile is.
+        Use get_placement_move to turn a row into a Move.
+        """
+        if pieces is None:
+            pieces = np.flatnonzero(self.pieces[player])
+        elif np.isscalar(pieces):
+            pieces = [pieces]
+
+        legal = self._legal[player]
+        connected = self.connected[player]
+        results = []
+        for piece_index in pieces:
+            if not self.pieces[player, piece_index]:
+                continue
+            for ori_index, ori in enumerate(self.placements.orientations[piece_index]):
+                num_y = self.board_h - max(yi for (xi, yi) in ori)
+                num_x = self.board_w - max(xi for (xi, yi) in ori)
+                if num_y <= 0 or num_x <= 0:
+                    continue
+                valid = np.ones((num_y, num_x), np.bool_)
+                attached = np.zeros((num_y, num_x), np.bool_)
+                for (xi, yi) in ori:
+                    valid &= legal[yi:yi + num_y, xi:xi + num_x]
+                    attached |= connected[yi:yi + num_y, xi:xi + num_x]
+                ys, xs = np.nonzero(valid & attached)
+                found = np.empty(len(xs), PLACEMENT_DTYPE)
+                found['piece'] = piece_index
+                found['orientation'] = ori_index
+                found['x'] = xs
+                found['y'] = ys
+                results.append(found)
+
+        if not results:
+            return np.empty(0, PLACEMENT_DTYPE)
+        found = np.concatenate(results)
+        return found[np.lexsort((found['orientation'], found['y'], found['x'], found['piece']))]
+
+    def get_placement_move(self, placement):
+        """
+        Returns the Move described by a row of get_legal_placements
+        """
+        piece_index = int(placement['piece'])
+        ori = self.placements.orientations[piece_index][int(placement['orientation'])]
+        return Move(self.piece_list.get_piece(piece_index), piece_index, ori, int(placement['x']), int(placement['y']))
+
+    def get_frontier(self, player):
+        """
+        Returns the (x, y) cells <player> can currently attach a piece to
+        """
+        return self.frontier[player]
+
     def check_move_valid(self, player, move):
         """
         Check if <player> can legally perform <move>.
@@ -174,14 +452,178 @@ class Board:
     def get_position(self, x, y):
         return self.state[y, x]
 
+    def get_distance_map(self, player=None):
+        """
+        Returns an array of the Chebyshev distance from each cell (indexed
+        [y, x]) to the nearest tile of <player>, or of any player if <player>
+        is None. Computed once per board state and cached.
+        """
+        if player not in self._distance_maps:
+            occupied = self.state != -1 if player is None else self.state == player
+            self._distance_maps[player] = chebyshev_distance_map(occupied)
+        return self._distance_maps[player]
+
+    def get_reachable(self, player):
+        """
+        Returns a 2D boolean array (indexed [y, x]) of the cells <player> may
+        still cover: the legal cells 8-connected to the player's frontier
+        through other legal cells. Every later piece is edge-connected and
+        attached to an earlier one by a corner, and cells never become legal
+        again, so no other cell can ever be covered by <player>. Computed once
+        per board state and cached, updated from the board before last_move
+        when possible.
+        """
+        if player not in self._reachable and player in self._previous_reachable:
+            reachable = self._update_reachable(player, self._previous_reachable[player], self.last_move)
+            if reachable is not None:
+                self._reachable[player] = reachable
+        if player not in self._reachable:
+            legal = self._legal[player]
+            reachable = np.zeros_like(legal)
+            for (x, y) in self.frontier[player]:
+                reachable[y, x] = True
+            while True:
+                # Grow by one cell in every direction: a 3x3 dilation, done one axis at a time
+                grown = reachable.copy()
+                grown[1:] |= reachable[:-1]
+                grown[:-1] |= reachable[1:]
+                rows = grown.copy()
+                grown[:, 1:] |= rows[:, :-1]
+                grown[:, :-1] |= rows[:, 1:]
+                grown &= legal
+                if (grown == reachable).all():
+                    break
+                reachable = grown
+            self._reachable[player] = reachable
+        return self._reachable[player]
+
+    def _update_reachable(self, player, reachable, move):
+        """
+        Returns the cells <player> may still cover (see get_reachable) now
+        that <move> was added, given the cells <reachable> they could cover
+        before it, or None if they must be computed again.
+
+        A move only takes cells out of the region. If the cells left around
+        the lost ones are still 8-connected and hold one of the player's
+        attachment points, any path through a lost cell can go around it, so
+        the rest of the region is still reachable.
+        """
+        xs = [xi + move.x for (xi, yi) in move.orientation]
+        ys = [yi + move.y for (xi, yi) in move.orientation]
+        (x0, x1) = (max(min(xs) - 2, 0), min(max(xs) + 3, self.board_w))
+        (y0, y1) = (max(min(ys) - 2, 0), min(max(ys) + 3, self.board_h))
+        window = reachable[y0:y1, x0:x1]
+        legal = self._legal[player, y0:y1, x0:x1]
+        lost = window & ~legal
+        if not lost.any():
+            return reachable
+
+        # The cells left next to a lost cell
+        around = lost.copy()
+        around[1:] |= lost[:-1]
+        around[:-1] |= lost[1:]
+        rows = around.copy()
+        around[:, 1:] |= rows[:, :-1]
+        around[:, :-1] |= rows[:, 1:]
+        around &= window & legal
+        if not (around & self.connected[player, y0:y1, x0:x1]).any():
+            return None  # no attachment point left around them
+        # Flood the cells around from one of them, numbered with a spare column so rows don't wrap
+        stride = x1 - x0 + 1
+        (ys, xs) = np.nonzero(around)
+        cells = set((ys * stride + xs).tolist())
+        offsets = (-stride - 1, -stride, -stride + 1, -1, 1, stride - 1, stride, stride + 1)
+        todo = [cells.pop()]
+        while todo:
+            cell = todo.pop()
+            for offset in offsets:
+                if cell + offset in cells:
+                    cells.remove(cell + offset)
+                    todo.append(cell + offset)
+        if cells:
+            return None
+
+        reachable = reachable.copy()
+        reachable[y0:y1, x0:x1] &= legal
+        return reachable
+
+    def to_bytes(self):
+        """
+        Returns a compact bytes form of the board (tiles, remaining pieces and
+        last move), e.g. to send it to another process. See from_bytes.
+        """
+        last_move = -1 if self.last_move is None or self.last_move.placement_id is None else self.last_move.placement_id
+        return self.state.tobytes() + self.pieces.tobytes() + np.int32(last_move).tobytes()
+
+    def from_bytes(self, data):
+        """
+        Returns the board described by <data> (returned by to_bytes), which must
+        be reachable from this board: its starting points, targets, piece_list
+        and placements are taken from this board, and the rest of its state is
+        rebuilt from its tiles.
+        """
+        num_cells = self.board_w * self.board_h
+        num_pieces = self.pieces.size
+        board = self.__copy__()
+        board.state = np.frombuffer(data, np.int8, num_cells).reshape(self.state.shape).copy()
+        board.pieces = np.frombuffer(data, np.bool_, num_pieces, num_cells).reshape(self.pieces.shape).copy()
+        last_move = int(np.frombuffer(data, np.int32, 1, num_cells + num_pieces)[0])
+        board.last_move = None if last_move == -1 else self.placements.get_move(last_move)
+
+        occupied = board.state != -1
+        for p in range(self.num_players):
+            tiles = board.state == p
+            board.scores[p] = int(tiles.sum())
+            board._legal[p] = ~occupied & ~_edge_neighbours(tiles)
+            board.connected[p] |= _corner_neighbours(tiles)
+            board.frontier[p] = set((x, y) for (y, x) in zip(*np.nonzero(board.connected[p] & board._legal[p])))
+        board._distance_maps = {}
+        board._reachable = {}
+        board._previous_reachable = {}
+        board.zobrist_key = self.zobrist.get_key(board)
+        if board.targets:
+            board.track_targets(board.targets)
+        return board
+
+    def __getstate__(self):
+        # The placement and Zobrist tables and cached arrays are rebuilt after unpickling
+        state = self.__dict__.copy()
+        del state['placements']
+        del state['zobrist']
+        state['_distance_maps'] = {}
+        state['_reachable'] = {}
+        state['_previous_reachable'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.placements = placements.get_placement_table(self.piece_list, self.board_w, self.board_h)
+        self.zobrist = zobrist.get_zobrist_table(self.num_players, self.piece_list, self.board_w, self.board_h)
+
     def score(self, player):
         return self.scores[player]
 
+    def key(self, symmetry=IDENTITY):
+        """
+        Returns an immutable snapshot of the board (its tiles and remaining
+        pieces), e.g. to remember boards that are later modified in place.
+        Given a <symmetry> (see SYMMETRIES), the snapshot is of the board's
+        image by that symmetry.
+        """
+        if symmetry == IDENTITY:
+            return self.state.tobytes() + self.pieces.tobytes()
+        return transform_array(self.state, symmetry).tobytes() + self.pieces.tobytes()
+
     def __eq__(self, other):
-        return np.array_equal(self.state, other.state) and np.array_equal(self.pieces, other.pieces)
+        if self.zobrist_key != other.zobrist_key:
+            return False
+        if np.array_equal(self.state, other.state) and np.array_equal(self.pieces, other.pieces):
+            return True
+        zobrist.collisions += 1
+        return False
 
     def __hash__(self):
-        return hash(str(self.state))
+        return self.zobrist_key
 
     def __str__(self):
         out_str = []
@@ -195,10 +637,15 @@ class Board:
         return ''.join(out_str)
 
     def __copy__(self):
-        cpy_board = Board(self.board_w, self.board_h, self.num_players, self.piece_list)
+        cpy_board = Board.__new__(Board)
+        cpy_board.__dict__.update(self.__dict__)
         cpy_board.state = np.copy(self.state)
         cpy_board._legal = np.copy(self._legal)
         cpy_board.connected = np.copy(self.connected)
+        cpy_board.frontier = [set(frontier) for frontier in self.frontier]
+        cpy_board.target_dists = self.target_dists[:]
+        cpy_board._distance_maps = dict(self._distance_maps)
+        cpy_board._reachable = dict(self._reachable)
         cpy_board.pieces = np.copy(self.pieces)
         cpy_board.scores = self.scores[:]
         return cpy_board
@@ -213,14 +660,16 @@ class Move:
     - x/y: the center coordinates of the piece [0-19)
     - Rotation: how many times the piece should be rotated CW [0-3]
     - Flip: whether the piece should be flipped (True/False)
+    - placement_id: the id of the move in a PlacementTable, if it came from one
     """
 
-    def __init__(self, piece, piece_index, orientation, x=0, y=0):
+    def __init__(self, piece, piece_index, orientation, x=0, y=0, placement_id=None):
         self.piece = piece
         self.piece_index = piece_index
         self.x = x
         self.y = y
         self.orientation = orientation
+        self.placement_id = placement_id
 
     def __str__(self):
         out_str = [[' ' for _ in range(5)] for _ in range(5)]
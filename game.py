@@ -1,11 +1,28 @@
-from inputs import RandomInput
+from inputs import RandomInput, MCTSInput, ParallelMCTSInput, AlphaBetaInput
 from pieces import PieceList
+from bitboard import BitBoard
 from blokus_problems import *
 from search import astar
-from displays import GuiDisplay
+from displays import GuiDisplay, NoDisplay
+import multiprocessing
+import json
+import csv
 import sys
 import os
 import ast
+import functools
+import time
+
+BOARD_ENGINES = {'numpy': Board, 'bitboard': BitBoard}
+
+# The players game.py can seat, by name. Each is built with a seed keyword
+PLAYER_INPUTS = {'random': RandomInput,
+                 'mcts': functools.partial(MCTSInput, iterations=100, time_limit=None),
+                 'mcts-heuristic': functools.partial(MCTSInput, iterations=100, time_limit=None, rollout='heuristic'),
+                 'mcts-root': functools.partial(ParallelMCTSInput, iterations=100, time_limit=None, mode='root'),
+                 'mcts-leaf': functools.partial(ParallelMCTSInput, iterations=25, time_limit=None, mode='leaf'),
+                 'paranoid': functools.partial(AlphaBetaInput, time_limit=None, max_depth=2, algorithm='paranoid'),
+                 'maxn': functools.partial(AlphaBetaInput, time_limit=None, max_depth=2, algorithm='maxn')}
 
 
 class GameEngine(object):
@@ -14,8 +31,12 @@ class GameEngine(object):
     get input/draw output
     """
 
-    def __init__(self, inputs, width, height, piece_list):
-        self.display = GuiDisplay(width, height, title='Intro to AI -- 67842 -- Ex1')
+    def __init__(self, inputs, width, height, piece_list, board_class=Board, display=None):
+        if not 1 <= len(inputs) <= 4:
+            raise ValueError("Need 1 to 4 players for a game")
+        if display is None:
+            display = GuiDisplay(width, height, title='Intro to AI -- 67842 -- Ex1')
+        self.display = display
         self.inputs = inputs
 
         self.piece_list = piece_list
@@ -26,15 +47,16 @@ class GameEngine(object):
         self.turn_num = 0
         self.passed = [False] * self.num_players
         self.score = [0] * self.num_players
-        self.board = Board(self.board_w, self.board_h, self.num_players, self.piece_list)
+        self.num_moves = 0
+        self.board = board_class(self.board_w, self.board_h, self.num_players, self.piece_list)
 
         # Set up initial corners for each player
         if self.num_players > 1:
-            self.board.connected[1, 0, self.board_w - 1] = True
+            self.board.set_starting_point(1, (0, self.board_w - 1))
             if self.num_players > 2:
-                self.board.connected[2, self.board_h - 1, 0] = True
+                self.board.set_starting_point(2, (self.board_h - 1, 0))
                 if self.num_players > 3:
-                    self.board.connected[3, self.board_h - 1, self.board_h - 1] = True
+                    self.board.set_starting_point(3, (self.board_h - 1, self.board_w - 1))
 
     def play_turn(self):
         """
@@ -61,7 +83,7 @@ class GameEngine(object):
                     continue
                 try:
                     self.score[p] += self.board.add_move(p, move)
-                    self.board.pieces[p, move.piece_index] = False
+                    self.num_moves += 1
                     break
                 except ValueError:
                     print("Error: move is illegal. Try again:")
@@ -79,17 +101,111 @@ class GameEngine(object):
         for p in range(self.num_players):
             print("Player %d: %d pts" % (p + 1, self.score[p]))
 
-    def play_game(self):
-        if len(self.inputs) != 4:
-            print("Error: Need 4 players for a game. ")
-            sys.exit(1)
+    def play_game(self, verbose=True):
         while not self.all_players_passed():
             self.play_turn()
 
-        self._print_scores()
+        if verbose:
+            self._print_scores()
         return self.score
 
 
+_piece_lists = {}
+
+
+def play_seeded_game(args):
+    """
+    Plays one headless game, for play_games. <args> is a tuple (seed,
+    player_names, width, height, pieces_file, engine): player p is
+    PLAYER_INPUTS[player_names[p]] built with the seed
+    seed * len(player_names) + p.
+
+    Returns the final scores, the number of moves played and the time the
+    game took in seconds.
+    """
+    (seed, player_names, width, height, pieces_file, engine) = args
+    if pieces_file not in _piece_lists:
+        _piece_lists[pieces_file] = PieceList(pieces_file)
+    inputs = [PLAYER_INPUTS[name](seed=seed * len(player_names) + p) for (p, name) in enumerate(player_names)]
+
+    game = GameEngine(inputs, width, height, _piece_lists[pieces_file], BOARD_ENGINES[engine], NoDisplay())
+    # Not timed: building the first engine of a process builds its placement table
+    start_time = time.time()
+    scores = game.play_game(verbose=False)
+    for player_input in inputs:
+        player_input.close()
+    return scores, game.num_moves, time.time() - start_time
+
+
+def play_games(num_games, player_names, width, height, pieces_file, engine='numpy', workers=1, seed=0):
+    """
+    Plays <num_games> headless games between the players named <player_names>
+    (see PLAYER_INPUTS), using <workers> processes. Game i is played with the
+    seed <seed> + i, so a batch can be reproduced exactly.
+
+    Returns aggregate statistics (see summarize_games).
+    """
+    tasks = [(seed + i, player_names, width, height, pieces_file, engine) for i in range(num_games)]
+    start_time = time.time()
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(play_seeded_game, tasks, chunksize=max(1, num_games // (workers * 4)))
+    else:
+        results = [play_seeded_game(task) for task in tasks]
+    return summarize_games(results, player_names, time.time() - start_time)
+
+
+def summarize_games(results, player_names, wall_time):
+    """
+    Returns a dict of statistics over the (scores, moves, seconds) results of
+    play_seeded_game. A game won by several tied players counts as a fraction
+    of a win for each of them.
+    """
+    num_games = len(results)
+    wins = [0.0] * len(player_names)
+    total_scores = [0] * len(player_names)
+    for (scores, _, _) in results:
+        best = max(scores)
+        winners = [p for (p, score) in enumerate(scores) if score == best]
+        for p in winners:
+            wins[p] += 1.0 / len(winners)
+        for (p, score) in enumerate(scores):
+            total_scores[p] += score
+
+    total_moves = sum(moves for (_, moves, _) in results)
+    game_time = sum(seconds for (_, _, seconds) in results)
+    return {
+        'games': num_games,
+        'moves': total_moves,
+        'game_seconds': game_time,
+        'wall_seconds': wall_time,
+        'moves_per_second': total_moves / game_time if game_time else 0.0,
+        'players': [{'player': p + 1,
+                     'input': name,
+                     'wins': wins[p],
+                     'win_rate': wins[p] / num_games if num_games else 0.0,
+                     'mean_score': total_scores[p] / num_games if num_games else 0.0}
+                    for (p, name) in enumerate(player_names)],
+    }
+
+
+def write_stats(stats, out, stats_format='json'):
+    """
+    Writes the statistics of play_games to the file object <out>, as JSON or
+    as CSV (one row per player, with the batch totals repeated on each row).
+    """
+    if stats_format == 'json':
+        json.dump(stats, out, indent=2)
+        out.write('\n')
+        return
+    totals = ['games', 'moves', 'game_seconds', 'wall_seconds', 'moves_per_second']
+    writer = csv.writer(out)
+    writer.writerow(['player', 'input', 'wins', 'win_rate', 'mean_score'] + totals)
+    for player in stats['players']:
+        writer.writerow([player['player'], player['input'], player['wins'], player['win_rate'],
+                         player['mean_score']] + [stats[total] for total in totals])
+
+
 def play_simple_search(problem, search_func):
     back_trace = search_func(problem)
     display = GuiDisplay(problem.board.board_w, problem.board.board_h, title='Intro to AI -- 67842 -- Ex1')
@@ -107,8 +223,8 @@ def play_simple_search(problem, search_func):
     print("Expanded nodes: %d, score: %d" % (problem.expanded, board.score(0)))
 
 
-def play_a_star_search(problem, heuristic):
-    back_trace = astar(problem, heuristic)
+def play_a_star_search(problem, heuristic, search_func=astar):
+    back_trace = search_func(problem, heuristic)
     display = GuiDisplay(problem.board.board_w, problem.board.board_h, title='Intro to AI -- 67842 -- Ex1')
     board = problem.get_start_state()
 
@@ -170,6 +286,8 @@ def main():
                   - starts a game between 4 random agents
                (2) python game.py -p tiny_set.txt -s 4 7
                OR  python game.py -s 14 14 -f ucs -z cover [(1, 1), (5, 9), (9, 6)]
+               (3) python game.py --games 1000 --workers 8 --no-display -e bitboard
+                  - plays 1000 games between 4 random agents and prints statistics
     """
     parser = OptionParser(usage_str)
 
@@ -181,7 +299,7 @@ def main():
     parser.add_option('-f', '--search-function', dest='search_func',
                       metavar='FUNC', help='search function to use. This option is ignored for sub-optimal search. ',
                       type='choice',
-                      choices=['dfs', 'bfs', 'ucs', 'astar'], default='dfs')
+                      choices=['dfs', 'bfs', 'ucs', 'astar', 'idastar', 'wastar', 'beam', 'arastar', 'hdastar'], default='dfs')
     parser.add_option('-H', '--heuristic', dest='h_func',
                       help='heuristic function to use for A* search. \
                       This option is ignored for other search functions. ',
@@ -191,6 +309,23 @@ def main():
                       choices=['fill', 'diagonal', 'corners', 'cover', 'sub-optimal', 'mini-contest'], default=None)
     parser.add_option('-x', '--start-point', dest='start', type='int', nargs=2,
                       help='starting point', default=(0, 0))
+    parser.add_option('-e', '--engine', dest='engine', type='choice',
+                      help='the board implementation to use', choices=list(BOARD_ENGINES), default='numpy')
+    parser.add_option('--players', dest='players', metavar='NAMES',
+                      help='comma separated inputs of the players of a game, among: %s' % ', '.join(PLAYER_INPUTS),
+                      default='random,random,random,random')
+    parser.add_option('--games', dest='games', type='int', metavar='N',
+                      help='play N headless games and print statistics about them', default=None)
+    parser.add_option('--workers', dest='workers', type='int', metavar='K',
+                      help='number of processes playing the games of --games', default=1)
+    parser.add_option('--seed', dest='seed', type='int',
+                      help='seed of the first game of --games (game i uses seed + i)', default=0)
+    parser.add_option('--stats-format', dest='stats_format', type='choice', choices=['json', 'csv'],
+                      help='format of the statistics of --games (json or csv)', default='json')
+    parser.add_option('--output', dest='output', metavar='FILE',
+                      help='write the statistics of --games to FILE instead of the standard output', default=None)
+    parser.add_option('--no-display', dest='display', action='store_false',
+                      help="don't draw the game (games of --games are never drawn)", default=True)
 
     options, cover_points = parser.parse_args()
     if (options.puzzle == 'cover' or options.puzzle == 'sub-optimal') and len(cover_points) == 0:
@@ -200,37 +335,63 @@ def main():
         targets = ast.literal_eval(''.join(cover_points))
 
     piece_list = PieceList(options.pieces_file)
-
-    if options.puzzle is None:
-        inputs = [RandomInput() for _ in range(4)]
-        engine = GameEngine(inputs, options.size[1], options.size[0], piece_list)
+    board_class = BOARD_ENGINES[options.engine]
+
+    player_names = options.players.split(',') if options.players else []
+    if not 1 <= len(player_names) <= 4:
+        parser.error('need 1 to 4 players, got %d' % len(player_names))
+    for name in player_names:
+        if name not in PLAYER_INPUTS:
+            parser.error('unknown player input: ' + name)
+
+    if options.games is not None:
+        stats = play_games(options.games, player_names, options.size[1], options.size[0], options.pieces_file,
+                           options.engine, options.workers, options.seed)
+        if options.output is None:
+            write_stats(stats, sys.stdout, options.stats_format)
+        else:
+            with open(options.output, 'w', newline='') as out:
+                write_stats(stats, out, options.stats_format)
+
+    elif options.puzzle is None:
+        inputs = [PLAYER_INPUTS[name]() for name in player_names]
+        display = None if options.display else NoDisplay()
+        engine = GameEngine(inputs, options.size[1], options.size[0], piece_list, board_class, display)
         engine.play_game()
+        for player_input in inputs:
+            player_input.close()
 
     elif options.puzzle == 'sub-optimal':
-        problem = ClosestLocationSearch(options.size[1], options.size[0], piece_list, options.start, targets)
+        problem = ClosestLocationSearch(options.size[1], options.size[0], piece_list, options.start, targets,
+                                        board_class)
         play_approximate_search(problem)
 
     elif options.puzzle == 'mini-contest':
-        problem = MiniContestSearch(options.size[1], options.size[0], piece_list, options.start, targets)
+        problem = MiniContestSearch(options.size[1], options.size[0], piece_list, options.start, targets,
+                                    board_class)
         play_approximate_search(problem)
 
-    elif options.search_func in ['dfs', 'bfs', 'ucs', 'astar']:
+    elif options.search_func in ['dfs', 'bfs', 'ucs', 'astar', 'idastar', 'wastar', 'beam', 'arastar', 'hdastar']:
         if options.puzzle == 'fill':
-            problem = BlokusFillProblem(options.size[1], options.size[0], piece_list, options.start)
+            problem = BlokusFillProblem(options.size[1], options.size[0], piece_list, options.start, board_class)
         elif options.puzzle == 'corners':
-            problem = BlokusCornersProblem(options.size[1], options.size[0], piece_list, options.start)
+            problem = BlokusCornersProblem(options.size[1], options.size[0], piece_list, options.start, board_class)
         elif options.puzzle == 'cover':
-            problem = BlokusCoverProblem(options.size[1], options.size[0], piece_list, options.start, targets)
+            problem = BlokusCoverProblem(options.size[1], options.size[0], piece_list, options.start, targets,
+                                         board_class)
 
+        search = __import__('search')
         if options.search_func in ['dfs', 'bfs', 'ucs']:
-            search = __import__('search')
             play_simple_search(problem, getattr(search, options.search_func))
-        elif options.search_func == 'astar':
-            play_a_star_search(problem, load_heuristic(options.h_func))
+        else:
+            play_a_star_search(problem, load_heuristic(options.h_func), getattr(search, options.search_func))
     else:
         raise Exception('unrecognized options')
 
+    return options
+
 
 if __name__ == "__main__":
-    main()
-    input("Press Enter to continue...")
+    options = main()
+    if options.display and options.games is None:
+        input("Press Enter to continue...")
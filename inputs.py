@@ -1,3 +1,13 @@
+import math
+import multiprocessing
+import os
+import random
+import time
+
+from bitboard import BitBoard
+from search import Budget
+
+
 class Input(object):
     """
     The Input class defines an interface for the game engine to get input
@@ -25,17 +35,625 @@ class Input(object):
         """
         raise NotImplementedError(Input.input_error_string)
 
+    def close(self):
+        """
+        Releases what the input holds on to (e.g. worker processes) once it's
+        done playing.
+        """
+        pass
+
 
 class RandomInput(Input):
     """RandomInput players choose random moves (equally distributed over piece
     number, x/y, and rotation/flip)
+
+    Given a seed, a RandomInput always makes the same choices in the same
+    positions.
     """
 
-    def get_move(self, player, board):
-        import random
+    def __init__(self, seed=None):
+        self.random = random.Random(seed)
 
+    def get_move(self, player, board):
         move_list = board.get_legal_moves(player)
         if move_list:
-            return move_list[random.randint(0, len(move_list) - 1)]
+            return move_list[self.random.randint(0, len(move_list) - 1)]
         # else
         return None
+
+
+def get_next_turn(board, player):
+    """
+    Returns the player to move after <player> on <board>, with their legal
+    moves, or (None, []) if nobody can move anymore.
+
+    Players move in turn, skipping those that have no legal move: as every move
+    only takes cells and pieces away, a player who can't move never will again.
+    """
+    for i in range(1, board.num_players + 1):
+        next_player = (player + i) % board.num_players
+        moves = board.get_legal_moves(next_player)
+        if moves:
+            return next_player, moves
+    return None, []
+
+
+def get_win_rewards(board):
+    """
+    Returns the reward of each player of a finished game on <board>: 1 for the
+    player with the highest score, shared equally between tied players.
+    """
+    best = max(board.scores)
+    winners = [p for (p, score) in enumerate(board.scores) if score == best]
+    return [1.0 / len(winners) if p in winners else 0.0 for p in range(board.num_players)]
+
+
+class MCTSNode(object):
+    """
+    A node of an MCTSInput search tree. It stands for the position reached by
+    playing <move> from its parent's position, where <player> is to move
+    (None once the game is over):
+    - untried: the moves of <player> that have no child yet
+    - visits: the number of playouts that went through the node
+    - rewards: the total reward of each player over those playouts
+    """
+
+    __slots__ = ('player', 'move', 'parent', 'children', 'untried', 'visits', 'rewards')
+
+    def __init__(self, player, moves, num_players, move=None, parent=None):
+        self.player = player
+        self.move = move
+        self.parent = parent
+        self.children = []
+        self.untried = list(moves)
+        self.visits = 0
+        self.rewards = [0.0] * num_players
+
+    def select_child(self, exploration):
+        """
+        Returns the child maximizing UCB1 for the player to move here
+        """
+        log_visits = math.log(self.visits)
+        player = self.player
+        return max(self.children,
+                   key=lambda child: (child.rewards[player] / child.visits +
+                                      exploration * math.sqrt(log_visits / child.visits)))
+
+
+class MCTSInput(Input):
+    """
+    MCTSInput players pick their moves with Monte Carlo tree search (UCT).
+
+    Each iteration walks down the tree with UCB1, adds one node, and finishes
+    the game with a playout from there. A player's reward is 1 for winning the
+    playout (see get_win_rewards), and every node picks its children by the
+    rewards of the player to move there, so the search assumes each player
+    plays for themselves. The move played is the most visited one.
+
+    The search stops after <iterations> iterations, or after <time_limit>
+    seconds, whichever comes first (None for no limit; set iterations for
+    reproducible games). Playouts pick their moves:
+    - 'random': uniformly among the legal moves
+    - 'heuristic': uniformly among the legal moves placing the most tiles
+
+    The search runs on a BitBoard copy of the board, where playouts are cheap
+    (random playouts draw their moves with BitBoard.get_random_move).
+    After each move, stats holds the playouts, seconds and playouts per
+    second of the search (printed if <verbose>), so time budgets can be sized.
+    """
+
+    def __init__(self, iterations=None, time_limit=1.0, exploration=math.sqrt(2), rollout='random',
+                 seed=None, verbose=False):
+        if iterations is None and time_limit is None:
+            raise ValueError("MCTSInput needs an iteration or time limit")
+        if rollout not in ('random', 'heuristic'):
+            raise ValueError("Unknown rollout policy: " + rollout)
+        self.iterations = iterations
+        self.time_limit = time_limit
+        self.exploration = exploration
+        self.rollout = rollout
+        self.random = random.Random(seed)
+        self.verbose = verbose
+        self.stats = None
+
+    def get_move(self, player, board):
+        move_list = board.get_legal_moves(player)
+        if not move_list:
+            return None
+        if len(move_list) == 1:
+            return move_list[0]
+
+        root_board = BitBoard.from_board(board)
+        root = MCTSNode(player, move_list, board.num_players)
+        start_time = time.time()
+        playouts = self.search(root, root_board)
+        seconds = time.time() - start_time
+
+        self._report(playouts, seconds)
+        return max(root.children, key=lambda child: child.visits).move
+
+    def _report(self, playouts, seconds):
+        self.stats = {'playouts': playouts,
+                      'seconds': seconds,
+                      'playouts_per_second': playouts / seconds if seconds else 0.0}
+        if self.verbose:
+            print("MCTS: %d playouts in %.2fs (%.0f playouts/s)" % (playouts, seconds,
+                                                                   self.stats['playouts_per_second']))
+
+    def search(self, root, root_board):
+        """
+        Runs iterations from <root>, whose position is <root_board>, until the
+        budget is spent. Returns the number of playouts played.
+        """
+        budget = Budget(self.time_limit, self.iterations)
+        budget.start()
+        while True:
+            self.iterate(root, root_board)
+            if not budget.spend():
+                return budget.expansions
+
+    def iterate(self, root, root_board):
+        """
+        Runs one selection / expansion / playout / backpropagation iteration
+        """
+        (node, board) = self.select_leaf(root, root_board)
+        self.backpropagate(node, self.playout(board, node.player, node.untried))
+
+    def select_leaf(self, root, root_board):
+        """
+        Walks down from <root> with UCB1 and expands a new child at the end of
+        the path (unless it ends the game). Returns that node and its position.
+        """
+        board = root_board.__copy__()
+        node = root
+
+        # Selection
+        while not node.untried and node.children:
+            node = node.select_child(self.exploration)
+            board.add_move(node.parent.player, node.move)
+
+        # Expansion
+        if node.untried:
+            move = node.untried.pop(self.random.randrange(len(node.untried)))
+            board.add_move(node.player, move)
+            (player, moves) = get_next_turn(board, node.player)
+            child = MCTSNode(player, moves, board.num_players, move, node)
+            node.children.append(child)
+            node = child
+        return node, board
+
+    @staticmethod
+    def backpropagate(node, rewards, visits=1):
+        """
+        Adds <visits> playouts with the total <rewards> to <node> and its
+        ancestors
+        """
+        while node is not None:
+            node.visits += visits
+            for p in range(len(rewards)):
+                node.rewards[p] += rewards[p]
+            node = node.parent
+
+    def playout(self, board, player, moves):
+        """
+        Finishes the game on <board>, where <player> is to move with the legal
+        <moves>, and returns the rewards of the players.
+        """
+        if player is not None:
+            board.add_move(player, self.get_playout_move(board, player, moves))
+            finished = [False] * board.num_players
+            while not all(finished):
+                player = (player + 1) % board.num_players
+                if finished[player]:
+                    continue
+                move = self.get_playout_move(board, player)
+                if move is None:
+                    finished[player] = True
+                else:
+                    board.add_move(player, move)
+        return get_win_rewards(board)
+
+    def get_playout_move(self, board, player, moves=None):
+        """
+        Returns the move <player> plays in a playout on <board> (None if they
+        can't move), picking from their legal <moves> if they're known.
+        """
+        if self.rollout == 'random' and moves is None:
+            return board.get_random_move(player, self.random)
+        if moves is None:
+            moves = board.get_legal_moves(player)
+            if not moves:
+                return None
+        if self.rollout == 'heuristic':
+            most_tiles = max(move.piece.get_num_tiles() for move in moves)
+            moves = [move for move in moves if move.piece.get_num_tiles() == most_tiles]
+        return moves[self.random.randrange(len(moves))]
+
+
+def _search_tree(args):
+    """
+    Grows one tree of a root-parallel ParallelMCTSInput search. Returns the
+    number of playouts played and the (placement id, visits) of every move
+    of the root.
+    """
+    (board, player, options, seed) = args
+    searcher = MCTSInput(seed=seed, **options)
+    root = MCTSNode(player, board.get_legal_moves(player), board.num_players)
+    playouts = searcher.search(root, board)
+    return playouts, [(child.move.placement_id, child.visits) for child in root.children]
+
+
+def _play_out(args):
+    """
+    Plays out one game of a leaf-parallel ParallelMCTSInput search, returning
+    the rewards of the players.
+    """
+    (board, player, rollout, seed) = args
+    return MCTSInput(time_limit=0, rollout=rollout, seed=seed).playout(board.__copy__(), player, None)
+
+
+class ParallelMCTSInput(MCTSInput):
+    """
+    ParallelMCTSInput players spread an MCTSInput search over several
+    processes, in one of two modes:
+    - 'root': <jobs> independent trees are grown from the current position,
+      each with the iteration / time budget of the search, and the move with
+      the most visits over all trees is played
+    - 'leaf': a single tree is grown, and each iteration plays <jobs>
+      playouts from the new node instead of one
+
+    <processes> worker processes run the trees or playouts (by default, one
+    per CPU; 1 runs them in this process, as do players of a daemonic process,
+    e.g. a game of game.play_games). Every tree and playout gets its own seed
+    drawn from the player's seed, so given a seed and an iteration limit, the
+    moves played don't depend on the number of processes. With a time limit,
+    trees that don't get a process of their own share the time of the move.
+    """
+
+    def __init__(self, iterations=None, time_limit=1.0, exploration=math.sqrt(2), rollout='random',
+                 seed=None, verbose=False, mode='root', jobs=4, processes=None):
+        MCTSInput.__init__(self, iterations, time_limit, exploration, rollout, seed, verbose)
+        if mode not in ('root', 'leaf'):
+            raise ValueError("Unknown parallel MCTS mode: " + mode)
+        self.mode = mode
+        self.jobs = jobs
+        if processes is None:
+            processes = os.cpu_count() or 1
+        if multiprocessing.current_process().daemon:
+            processes = 1
+        self.processes = processes
+        self._pool = None
+
+    def _map(self, func, tasks):
+        if self.processes == 1:
+            return [func(task) for task in tasks]
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(min(self.processes, self.jobs))
+        return self._pool.map(func, tasks, chunksize=1)
+
+    def close(self):
+        """
+        Stops the worker processes, if any
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def get_move(self, player, board):
+        if self.mode == 'leaf':
+            return MCTSInput.get_move(self, player, board)
+
+        move_list = board.get_legal_moves(player)
+        if not move_list:
+            return None
+        if len(move_list) == 1:
+            return move_list[0]
+
+        time_limit = self.time_limit
+        if time_limit is not None:
+            # Trees are grown in rounds of one tree per process
+            time_limit /= -(-self.jobs // min(self.processes, self.jobs))
+        options = {'iterations': self.iterations, 'time_limit': time_limit,
+                   'exploration': self.exploration, 'rollout': self.rollout}
+        root_board = BitBoard.from_board(board)
+        tasks = [(root_board, player, options, self.random.getrandbits(64)) for _ in range(self.jobs)]
+
+        start_time = time.time()
+        visits = dict((move.placement_id, 0) for move in move_list)
+        playouts = 0
+        for (tree_playouts, root_moves) in self._map(_search_tree, tasks):
+            playouts += tree_playouts
+            for (placement_id, move_visits) in root_moves:
+                visits[placement_id] += move_visits
+        seconds = time.time() - start_time
+
+        self._report(playouts, seconds)
+        return max(move_list, key=lambda move: visits[move.placement_id])
+
+    def search(self, root, root_board):
+        """
+        Leaf-parallel search: like MCTSInput.search, but each iteration plays
+        <jobs> playouts from its new node. Returns the number of playouts.
+        """
+        budget = Budget(self.time_limit, self.iterations)
+        budget.start()
+        while True:
+            (node, board) = self.select_leaf(root, root_board)
+            tasks = [(board, node.player, self.rollout, self.random.getrandbits(64)) for _ in range(self.jobs)]
+            rewards = [0.0] * board.num_players
+            for playout_rewards in self._map(_play_out, tasks):
+                for p in range(len(rewards)):
+                    rewards[p] += playout_rewards[p]
+            self.backpropagate(node, rewards, self.jobs)
+            if not budget.spend():
+                return budget.expansions * self.jobs
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside an AlphaBetaInput search once its time budget is spent
+    """
+    pass
+
+
+# Transposition table entry flags: the stored value is exact, or a lower / upper bound
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# Added to the evaluation of finished games won (or lost) by a player
+WIN_VALUE = 1000
+
+
+class AlphaBetaInput(Input):
+    """
+    AlphaBetaInput players pick their moves with a depth-limited adversarial
+    search, deepened iteratively until <time_limit> seconds are spent (or
+    <max_depth> plies are searched). One ply is one player's turn; players
+    who can't move are skipped (see get_next_turn).
+
+    Positions are evaluated for every player p as
+        scores[p] + frontier_weight * (number of cells p can attach to)
+    and as their final scores, plus WIN_VALUE for the winners, once the game
+    is over. The search is either:
+    - 'paranoid': the player assumes everybody else plays against them, and
+      maximizes their value minus the best value of the others with
+      alpha-beta pruning. With 2 players, this is plain alpha-beta minimax
+    - 'maxn': every player maximizes their own value (max^n). It can't prune,
+      so it searches shallower than 'paranoid' in the same time
+
+    Searched positions are kept in a transposition table of up to <tt_size>
+    entries, keyed by the boards' Zobrist keys (see zobrist.py). It's cleared
+    before every move, as paranoid values depend on the player to move at the
+    root. The deepening stops early once an iteration reaches no depth limit
+    (the whole game tree was searched), so entries record whether their
+    subtree did. Moves are tried in this order: the best move
+    stored for the position, the killer moves of the ply (the last 2 moves
+    that caused a cutoff there), then by history score (how often and how
+    deep each move was best), then biggest pieces first.
+
+    The search runs on a BitBoard copy of the board. A search that runs out
+    of time is abandoned, and the move of the deepest complete iteration is
+    played. After each move, stats holds the depth reached, the nodes visited
+    and the seconds spent (printed if <verbose>).
+    """
+
+    def __init__(self, time_limit=1.0, max_depth=None, algorithm='paranoid', frontier_weight=0.5,
+                 tt_size=1000000, seed=None, verbose=False):
+        if time_limit is None and max_depth is None:
+            raise ValueError("AlphaBetaInput needs a time or depth limit")
+        if algorithm not in ('paranoid', 'maxn'):
+            raise ValueError("Unknown search algorithm: " + algorithm)
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.algorithm = algorithm
+        self.frontier_weight = frontier_weight
+        self.tt_size = tt_size
+        self.verbose = verbose
+        self.transpositions = {}
+        self.history = {}
+        self.killers = []
+        self.stats = None
+        # AlphaBetaInput is deterministic; <seed> is accepted like other inputs
+        self.seed = seed
+
+    def get_move(self, player, board):
+        move_list = board.get_legal_moves(player)
+        if not move_list:
+            return None
+        if len(move_list) == 1:
+            return move_list[0]
+
+        search_board = BitBoard.from_board(board)
+        self.root_player = player
+        self.deadline = None if self.time_limit is None else time.time() + self.time_limit
+        self.nodes = 0
+        self.transpositions = {}
+        self.killers = []
+
+        start_time = time.time()
+        best_move = None
+        depth = 0
+        while self.max_depth is None or depth < self.max_depth:
+            self.cutoffs = 0
+            try:
+                best_move = self.search_root(search_board, player, move_list, depth + 1, best_move)
+            except SearchTimeout:
+                break
+            depth += 1
+            if not self.cutoffs:
+                # The whole game tree was searched
+                break
+        seconds = time.time() - start_time
+
+        self.stats = {'depth': depth, 'nodes': self.nodes, 'seconds': seconds}
+        if self.verbose:
+            print("%s: depth %d, %d nodes in %.2fs" % (self.algorithm, depth, self.nodes, seconds))
+        if best_move is None:
+            # Not even one ply could be searched: play the move ordered first
+            best_move = self.order_moves(move_list, player, 0)[0]
+        return best_move
+
+    def search_root(self, board, player, move_list, depth, previous_best=None):
+        """
+        Searches the moves of <player> <depth> plies deep, starting with the
+        best move of the previous iteration, and returns the best one.
+        """
+        best_move = None
+        best_value = None
+        alpha = -math.inf
+        tt_move = None if previous_best is None else previous_best.placement_id
+        for move in self.order_moves(move_list, player, 0, tt_move):
+            value = self.search_move(board, player, move, depth, alpha, math.inf, 0)
+            own_value = value[player] if self.algorithm == 'maxn' else value
+            if best_value is None or own_value > best_value:
+                (best_move, best_value) = (move, own_value)
+                alpha = max(alpha, own_value)
+        return best_move
+
+    def search_move(self, board, player, move, depth, alpha, beta, ply):
+        """
+        Plays <player>'s <move> on <board> and returns the value of the
+        position reached, searched <depth> - 1 more plies
+        """
+        undo = board.make_move(player, move)
+        try:
+            return self.search(board, player, depth - 1, alpha, beta, ply + 1)
+        finally:
+            board.undo_move(undo)
+
+    def search(self, board, last_player, depth, alpha, beta, ply):
+        """
+        Returns the value of the position of <board>, where <last_player> just
+        moved, searched <depth> plies deep: a number for 'paranoid' searches
+        (exact only within [alpha, beta]), a list of the values of every
+        player for 'maxn' searches.
+
+        Counts in self.cutoffs the positions whose value is cut off by the
+        depth limit, including those of the transposition table.
+        """
+        self.nodes += 1
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout()
+        if depth == 0:
+            self.cutoffs += 1
+            return self.evaluate(board, False)
+
+        # The player to move depends on the position and on who moved last
+        tt_key = board.zobrist_key ^ board.zobrist.turns[last_player]
+        entry = self.transpositions.get(tt_key)
+        tt_move = None
+        if entry is not None:
+            (entry_depth, entry_value, entry_flag, entry_cut_off, tt_move) = entry
+            if entry_depth >= depth:
+                if entry_flag == EXACT:
+                    self.cutoffs += entry_cut_off
+                    return entry_value
+                if entry_flag == LOWER:
+                    alpha = max(alpha, entry_value)
+                elif entry_flag == UPPER:
+                    beta = min(beta, entry_value)
+                if alpha >= beta:
+                    self.cutoffs += entry_cut_off
+                    return entry_value
+
+        (player, moves) = get_next_turn(board, last_player)
+        if player is None:
+            return self.evaluate(board, True)
+
+        cutoffs = self.cutoffs
+
+        if self.algorithm == 'maxn':
+            best_value = None
+            best_move = None
+            for move in self.order_moves(moves, player, ply, tt_move):
+                value = self.search_move(board, player, move, depth, alpha, beta, ply)
+                if best_value is None or value[player] > best_value[player]:
+                    (best_value, best_move) = (value, move)
+            self.record_best_move(best_move, player, depth, ply, False)
+            self.store(tt_key, depth, best_value, EXACT, self.cutoffs > cutoffs, best_move)
+            return best_value
+
+        (original_alpha, original_beta) = (alpha, beta)
+        maximizing = player == self.root_player
+        best_value = -math.inf if maximizing else math.inf
+        best_move = None
+        for move in self.order_moves(moves, player, ply, tt_move):
+            value = self.search_move(board, player, move, depth, alpha, beta, ply)
+            if maximizing and value > best_value:
+                (best_value, best_move) = (value, move)
+                alpha = max(alpha, value)
+            elif not maximizing and value < best_value:
+                (best_value, best_move) = (value, move)
+                beta = min(beta, value)
+            if alpha >= beta:
+                self.record_best_move(best_move, player, depth, ply, True)
+                break
+        else:
+            self.record_best_move(best_move, player, depth, ply, False)
+
+        if best_value <= original_alpha:
+            flag = UPPER
+        elif best_value >= original_beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.store(tt_key, depth, best_value, flag, self.cutoffs > cutoffs, best_move)
+        return best_value
+
+    def evaluate(self, board, game_over):
+        """
+        Returns the value of <board> (see the class docstring)
+        """
+        if game_over:
+            best = max(board.scores)
+            values = [score + (WIN_VALUE if score == best else 0) for score in board.scores]
+        else:
+            values = [board.scores[p] + self.frontier_weight * len(board.get_frontier(p))
+                      for p in range(board.num_players)]
+        if self.algorithm == 'maxn':
+            return values
+        if len(values) == 1:
+            return values[0]
+        player = self.root_player
+        return values[player] - max(values[p] for p in range(len(values)) if p != player)
+
+    def store(self, tt_key, depth, value, flag, cut_off, best_move):
+        """
+        Stores the value of a position searched <depth> plies deep, <cut_off>
+        if the depth limit cut off part of its subtree. Once the table is
+        full, only the positions it already holds are updated.
+        """
+        if tt_key in self.transpositions or len(self.transpositions) < self.tt_size:
+            self.transpositions[tt_key] = (depth, value, flag, cut_off, best_move.placement_id)
+
+    def record_best_move(self, move, player, depth, ply, cutoff):
+        """
+        Credits <move> in the history table, and in the killer moves of <ply>
+        if it caused a <cutoff>
+        """
+        history_key = (player, move.placement_id)
+        self.history[history_key] = self.history.get(history_key, 0) + depth * depth
+        if cutoff:
+            while len(self.killers) <= ply:
+                self.killers.append([])
+            killers = self.killers[ply]
+            if move.placement_id not in killers:
+                killers.insert(0, move.placement_id)
+                del killers[2:]
+
+    def order_moves(self, moves, player, ply, tt_move=None):
+        """
+        Returns <moves> in the order they should be searched (see the class
+        docstring)
+        """
+        killers = self.killers[ply] if ply < len(self.killers) else []
+        history = self.history
+
+        def priority(move):
+            placement_id = move.placement_id
+            if placement_id == tt_move:
+                return (3, 0, 0)
+            if placement_id in killers:
+                return (2, -killers.index(placement_id), 0)
+            return (1, history.get((player, placement_id), 0), move.piece.get_num_tiles())
+        return sorted(moves, key=priority, reverse=True)
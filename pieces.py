@@ -14,6 +14,24 @@ def negate_list_positive(lst):
     return [x - list_min for x in new_list]
 
 
+def get_corner_tiles(orientation):
+    """
+    Helper function: return the tiles of an orientation that can be placed on
+    a cell diagonally attached to another piece.
+
+    Such a tile needs a diagonal direction (dx, dy) where neither (x+dx, y)
+    nor (x, y+dy) are part of the piece, since those two cells touch the
+    attaching piece's side.
+    """
+    corners = []
+    for (x, y) in orientation:
+        for (dx, dy) in ((-1, -1), (-1, 1), (1, -1), (1, 1)):
+            if (x + dx, y) not in orientation and (x, y + dy) not in orientation:
+                corners.append((x, y))
+                break
+    return tuple(corners)
+
+
 class Piece(object):
     """
     A piece is a collection of tiles with various (x,y) offsets.
@@ -82,6 +100,9 @@ class Piece(object):
         self.num_tiles = len(x_list)
         self.orientations = frozenset(self.orientations)
 
+        # Tiles of each orientation that can sit on an attachment point
+        self.corners = {ori: get_corner_tiles(ori) for ori in self.orientations}
+
         self.x = x_list
         self.y = y_list
 
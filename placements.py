@@ -0,0 +1,195 @@
+import hashlib
+import os
+import pickle
+
+import board
+
+"""
+Precomputed tables of every in-bounds placement of a PieceList on a board.
+"""
+
+# Directory tables are cached in when get_placement_table isn't given one
+CACHE_DIR = os.environ.get('BLOKUS_PLACEMENT_CACHE')
+
+_tables = {}
+
+
+class PlacementTable(object):
+    """
+    A PlacementTable enumerates every in-bounds placement (piece, orientation,
+    x, y) of a PieceList on a board_w x board_h board. Placement i is described
+    by:
+    - piece_index[i], orientation[i], x[i], y[i]: orientation[i] indexes
+      orientations[piece_index[i]], the piece's orientations in iteration order
+    - cells[i]: bitboard (bit y * board_w + x) of the cells it covers
+    - corners[i]: bitboard of the cells sharing a corner with those cells
+    - edges[i]: bitboard of the cells sharing an edge with those cells
+
+    Placements are numbered in (piece, x, y, orientation) order, so sorting ids
+    gives the same move order as Board.get_legal_moves.
+
+    The table also indexes placements by cell, for move generation:
+    - by_cell[c]: ids of the placements covering cell c
+    - by_anchor[c]: ids of the placements covering cell c with one of the
+      piece's corner tiles (see Piece.corners)
+    """
+
+    def __init__(self, piece_list, board_w, board_h):
+        self.piece_list = piece_list
+        self.board_w = board_w
+        self.board_h = board_h
+
+        self.orientations = [list(piece) for piece in piece_list]
+        self.piece_index = []
+        self.orientation = []
+        self.x = []
+        self.y = []
+        self.cells = []
+        self.corners = []
+        self.edges = []
+        self.by_cell = [[] for _ in range(board_w * board_h)]
+        self.by_anchor = [[] for _ in range(board_w * board_h)]
+
+        for piece_index, piece in enumerate(piece_list):
+            for x in range(board_w):
+                for y in range(board_h):
+                    for ori_index, ori in enumerate(self.orientations[piece_index]):
+                        if any(x + xi >= board_w or y + yi >= board_h for (xi, yi) in ori):
+                            continue
+                        self._add(piece_index, ori_index, x, y, ori, piece.corners[ori])
+
+        self._moves = [None] * len(self.cells)
+
+    def _add(self, piece_index, ori_index, x, y, ori, corner_tiles):
+        placement_id = len(self.cells)
+        cells = set((x + xi, y + yi) for (xi, yi) in ori)
+        edges = set()
+        corners = set()
+        for (cx, cy) in cells:
+            for (dx, dy) in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+                edges.add((cx + dx, cy + dy))
+            for (dx, dy) in ((-1, -1), (-1, 1), (1, -1), (1, 1)):
+                corners.add((cx + dx, cy + dy))
+
+        self.piece_index.append(piece_index)
+        self.orientation.append(ori_index)
+        self.x.append(x)
+        self.y.append(y)
+        self.cells.append(self._to_mask(cells))
+        self.corners.append(self._to_mask(corners))
+        self.edges.append(self._to_mask(edges - cells))
+        for (cx, cy) in cells:
+            self.by_cell[cy * self.board_w + cx].append(placement_id)
+        for (xi, yi) in corner_tiles:
+            self.by_anchor[(y + yi) * self.board_w + x + xi].append(placement_id)
+
+    def _to_mask(self, cells):
+        mask = 0
+        for (x, y) in cells:
+            if 0 <= x < self.board_w and 0 <= y < self.board_h:
+                mask |= 1 << (y * self.board_w + x)
+        return mask
+
+    def __len__(self):
+        return len(self.cells)
+
+    def get_candidates(self, anchors, first_move=False):
+        """
+        Return the sorted ids of the placements that cover one of the (x, y)
+        cells in <anchors> with a corner tile (or with any tile, if
+        <first_move> is True).
+        """
+        index = self.by_cell if first_move else self.by_anchor
+        candidates = set()
+        for (x, y) in anchors:
+            candidates.update(index[y * self.board_w + x])
+        return sorted(candidates)
+
+    def touches(self, placement_id, other_id):
+        """
+        Check if placement <other_id> covers a cell of placement <placement_id>
+        or a cell sharing an edge or a corner with one.
+        """
+        return self.cells[other_id] & (self.cells[placement_id] | self.edges[placement_id] |
+                                       self.corners[placement_id]) != 0
+
+    def get_move(self, placement_id):
+        """
+        Return the Move for placement <placement_id>. Moves are built once and
+        shared, so they must not be modified.
+        """
+        move = self._moves[placement_id]
+        if move is None:
+            piece_index = self.piece_index[placement_id]
+            ori = self.orientations[piece_index][self.orientation[placement_id]]
+            move = board.Move(self.piece_list.get_piece(piece_index), piece_index, ori,
+                              self.x[placement_id], self.y[placement_id], placement_id)
+            self._moves[placement_id] = move
+        return move
+
+    def save(self, fname):
+        """
+        Pickle the table to <fname>. The file is written under a temporary
+        name first, so other processes never read a partial table.
+        """
+        tmp_fname = '%s.%d.tmp' % (fname, os.getpid())
+        with open(tmp_fname, 'wb') as f:
+            pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_fname, fname)
+
+    @staticmethod
+    def load(fname, piece_list):
+        """
+        Read a table written by save() and attach it to <piece_list>.
+        """
+        with open(fname, 'rb') as f:
+            table = pickle.load(f)
+        table.piece_list = piece_list
+        return table
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['piece_list']
+        state['_moves'] = [None] * len(self.cells)
+        return state
+
+
+def get_table_name(piece_list, board_w, board_h):
+    """
+    Return a file name identifying the table for <piece_list> on a
+    <board_w> x <board_h> board.
+    """
+    signature = repr((board_w, board_h, [sorted(sorted(ori) for ori in piece) for piece in piece_list]))
+    return 'placements_%dx%d_%s.pickle' % (board_w, board_h, hashlib.sha1(signature.encode()).hexdigest()[:16])
+
+
+def get_placement_table(piece_list, board_w, board_h, cache_dir=None):
+    """
+    Return the PlacementTable of <piece_list> on a <board_w> x <board_h> board.
+
+    Tables are built once per process. If <cache_dir> (or CACHE_DIR, set from
+    the BLOKUS_PLACEMENT_CACHE environment variable) is given, they are also
+    read from / written to that directory, so they can be shared between runs
+    and processes.
+    """
+    key = (tuple(piece_list), board_w, board_h)
+    table = _tables.get(key)
+    if table is not None:
+        return table
+
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+    fname = None
+    if cache_dir is not None:
+        fname = os.path.join(cache_dir, get_table_name(piece_list, board_w, board_h))
+        if os.path.isfile(fname):
+            table = PlacementTable.load(fname, piece_list)
+
+    if table is None:
+        table = PlacementTable(piece_list, board_w, board_h)
+        if fname is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            table.save(fname)
+
+    _tables[key] = table
+    return table
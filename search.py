@@ -2,6 +2,15 @@
 In search.py, you will implement generic search algorithms
 """
 
+import copy
+import heapq
+import multiprocessing
+import os
+import pickle
+import queue
+import time
+import zlib
+
 import util
 
 
@@ -11,8 +20,29 @@ class SearchProblem:
     any of the methods (in object-oriented terminology: an abstract class).
 
     You do not need to change anything in this class, ever.
+
+    Problems that set lazy_successors to True also implement
+    get_successor_moves and get_successor. The search functions then only
+    build a successor state when they actually need it.
+
+    Problems whose states can be modified in place may also implement
+    make_move and undo_move, which depth_first_search(in_place=True) and
+    iterative_deepening_a_star_search use.
+
+    The searches recognize states they already reached by get_state_key, which
+    problems with symmetric states can override to return a canonical key
+    (see get_canonical_key).
+
+    Problems whose successors depend on the path a state was reached by, not
+    only on the state, set path_dependent_successors to True. A closed set
+    would then drop states reached again through a path with other
+    successors, so only iterative_deepening_a_star_search, which checks the
+    current path instead, accepts them. The other searches raise a ValueError.
     """
 
+    lazy_successors = False
+    path_dependent_successors = False
+
     def get_start_state(self):
         """
         Returns the start state for the search problem
@@ -48,8 +78,50 @@ class SearchProblem:
         """
         util.raiseNotDefined()
 
+    def get_successor_moves(self, state):
+        """
+        state: Search state
+
+        For a given state, this should return a list of pairs, (action, stepCost),
+        for the successors get_successors would return, without building them
+        """
+        util.raiseNotDefined()
+
+    def get_successor(self, state, action):
+        """
+        state: Search state
+        action: One of the actions returned by get_successor_moves(state)
+
+        Returns the state reached by performing action in state
+        """
+        util.raiseNotDefined()
+
+    def make_move(self, state, action):
+        """
+        state: Search state
+        action: One of the actions returned by get_successor_moves(state)
 
-def depth_first_search(problem):
+        Performs action on state in place, returning an undo record for undo_move
+        """
+        util.raiseNotDefined()
+
+    def undo_move(self, state, undo):
+        """
+        Restores state to what it was before the make_move call that returned undo
+        """
+        util.raiseNotDefined()
+
+    def get_state_key(self, state):
+        """
+        state: Search state
+
+        Returns a hashable key for state. States with equal keys are treated as
+        the same state by the searches, so they must have the same solutions
+        """
+        return get_state_key(state)
+
+
+def depth_first_search(problem, in_place=False, budget=None):
     """
     Search the deepest nodes in the search tree first.
 
@@ -62,51 +134,143 @@ def depth_first_search(problem):
     print("Start:", problem.getStartState())
     print("Is the start a goal?", problem.isGoalState(problem.getStartState()))
     print("Start's successors:", problem.getSuccessors(problem.getStartState()))
+
+    If in_place is True, a single state is modified with problem.make_move and
+    restored with problem.undo_move instead of keeping a state per node (see
+    in_place_depth_first_search).
+
+    If a budget is given, returns a SearchResult instead (see run_search).
     """
+    check_closed_set(problem)
+    if in_place:
+        return in_place_depth_first_search(problem, budget)
+    return run_search(_depth_first_steps(problem), budget)
+
+
+def _depth_first_steps(problem):
     stack = util.Stack()
-    visited = []
-    stack.push((problem.get_start_state(), []))
+    visited = set()  # keys of the expanded states
+    stack.push(Node(problem.get_start_state()))
 
     while not stack.isEmpty():
-        state, actions = stack.pop()
+        node = stack.pop()
+
+        if problem.is_goal_state(node.state):
+            return node.get_actions()
+
+        key = problem.get_state_key(node.state)
+        if key not in visited:
+            visited.add(key)
+            yield node
+            for child in expand(problem, node):
+                stack.push(child)
+
+    return []  # no solution
+
+
+def in_place_depth_first_search(problem, budget=None):
+    """
+    Depth first search on a single state that is modified in place.
+
+    Only the current path is kept: the undo records and the remaining actions
+    of each node on it. The visited set holds state keys (see get_state_key)
+    rather than states, which is required here since the state keeps
+    changing. Nodes are explored in the same order as depth_first_search, on
+    a copy of the start state, which is left unchanged.
+
+    If a budget is given, returns a SearchResult instead (see run_search),
+    whose best_node is the deepest node reached (see get_path_node).
+    """
+    return run_search(_in_place_depth_first_steps(problem), budget)
+
+
+def _in_place_depth_first_steps(problem):
+    state = copy.copy(problem.get_start_state())
+    if problem.is_goal_state(state):
+        return []
+
+    visited = {problem.get_state_key(state)}
+    actions = []
+    undos = []
+    costs = [0]
+    stack = [iter(reversed(problem.get_successor_moves(state)))]
+    yield get_path_node(state, actions)
+    deepest = 0
+
+    while stack:
+        successor = next(stack[-1], None)
+        if successor is None:
+            # All children explored, backtrack
+            stack.pop()
+            if undos:
+                problem.undo_move(state, undos.pop())
+                actions.pop()
+                costs.pop()
+            continue
+
+        (action, cost) = successor
+        undos.append(problem.make_move(state, action))
+        actions.append(action)
+        costs.append(costs[-1] + cost)
 
         if problem.is_goal_state(state):
             return actions
 
-        if state not in visited:
-            visited.append(state)
-            for successor, action, cost in problem.get_successors(state):
-                stack.push((successor, actions + [action]))
+        key = problem.get_state_key(state)
+        if key in visited:
+            problem.undo_move(state, undos.pop())
+            actions.pop()
+            costs.pop()
+            continue
+
+        visited.add(key)
+        stack.append(iter(reversed(problem.get_successor_moves(state))))
+        if len(actions) > deepest:
+            deepest = len(actions)
+            yield get_path_node(state, actions, costs[-1])
+        else:
+            yield None
 
     return []  # no solution
 
 
-def breadth_first_search(problem):
+def breadth_first_search(problem, budget=None):
     """
     Search the shallowest nodes in the search tree first.
+
+    If a budget is given, returns a SearchResult instead (see run_search).
     """
     "*** YOUR CODE HERE ***"
+    check_closed_set(problem)
+    return run_search(_breadth_first_steps(problem), budget)
+
+
+def _breadth_first_steps(problem):
     queue = util.Queue()
-    visited = []
-    queue.push((problem.get_start_state(), []))
+    visited = set()  # keys of the expanded states
+    queue.push(Node(problem.get_start_state()))
 
     while not queue.isEmpty():
-        state, actions = queue.pop()
+        node = queue.pop()
 
-        if problem.is_goal_state(state):
-            return actions
+        if problem.is_goal_state(node.state):
+            return node.get_actions()
 
-        if state not in visited:
-            visited.append(state)
-            for successor, action, cost in problem.get_successors(state):
-                queue.push((successor, actions + [action]))
+        key = problem.get_state_key(node.state)
+        if key not in visited:
+            visited.add(key)
+            yield node
+            for child in expand(problem, node):
+                queue.push(child)
 
     return []  # no solution
 
 
-def uniform_cost_search(problem):
+def uniform_cost_search(problem, budget=None):
     """
     Search the node of least total cost first.
+
+    If a budget is given, returns a SearchResult instead (see run_search).
     """
     "*** YOUR CODE HERE ***"
     # pq = util.PriorityQueue()
@@ -126,7 +290,7 @@ def uniform_cost_search(problem):
     #             pq.push(Node(successor, node.actions + [action], node, cost + node.cost), cost + node.cost)
     #
     # return []  # no solution
-    return a_star_search(problem)
+    return a_star_search(problem, budget=budget)
 
 def null_heuristic(state, problem=None):
     """
@@ -136,60 +300,869 @@ def null_heuristic(state, problem=None):
     return 0
 
 
-def a_star_search(problem, heuristic=null_heuristic):
+def a_star_search(problem, heuristic=null_heuristic, weight=1, budget=None):
     """
     Search the node that has the lowest combined cost and heuristic first.
+
+    The open list (see OpenList) breaks f ties in favour of the deeper node and
+    remembers the cheapest known cost of every state: a successor is dropped
+    before its heuristic is evaluated if its state was already reached at least
+    as cheaply, and queued entries superseded by a cheaper path are skipped.
+
+    For problems with lazy successors, a child is queued with the bound its
+    parent's heuristic gives (h(child) >= h(parent) - stepCost for a consistent
+    heuristic). Its state is built and its heuristic evaluated only when it is
+    popped, and it is queued again if its real f turns out to be higher.
+
+    With a weight above 1, nodes are ordered by g + weight * h instead
+    (weighted A*): solutions cost at most weight times the optimal cost, and
+    are usually found expanding far fewer nodes.
+
+    If a budget is given, returns a SearchResult instead (see run_search).
     """
     "*** YOUR CODE HERE ***"
-    queue = util.PriorityQueue()
+    check_closed_set(problem)
+    return run_search(_a_star_steps(problem, heuristic, weight), budget)
+
+
+def _a_star_steps(problem, heuristic, weight):
+    open_list = OpenList()
     start_state = problem.get_start_state()
-    start_node = Node(start_state, [], None, 0, heuristic(start_state, problem))
-    queue.push(start_node, start_node.f)  # node, cost
+    start_node = Node(start_state, h=weight * heuristic(start_state, problem))
+    open_list.register(start_node, problem.get_state_key(start_state))
+    open_list.push(start_node)
 
-    visited = dict()  # Maps state to the cost to reach that state
+    while not open_list.isEmpty():
+        node = open_list.pop()
 
-    while not queue.isEmpty():
-        node = queue.pop()
+        if node.key is None:
+            # A lazy node: its state is only known now
+            if not open_list.register(node, problem.get_state_key(node.state)):
+                continue
+        elif open_list.is_stale(node):
+            continue
+
+        if not node.evaluated:
+            bound = node.f
+            node.evaluate(weight * heuristic(node.state, problem))
+            if node.f == float('inf'):
+                continue
+            if node.f > bound:
+                open_list.push(node)
+                continue
 
         if problem.is_goal_state(node.state):
-            return node.actions
+            return node.get_actions()
+
+        yield node
+        for child in expand(problem, node, weight):
+            if not problem.lazy_successors:
+                if not open_list.register(child, problem.get_state_key(child.state)):
+                    continue
+                child.evaluate(weight * heuristic(child.state, problem))
+            if child.f != float('inf'):
+                open_list.push(child)
+
+    return []  # No solution
+
+
+def weighted_a_star_search(problem, heuristic=null_heuristic, weight=2, budget=None):
+    """
+    A* ordered by g + weight * h: returns a solution costing at most weight
+    times the optimal cost (see a_star_search).
+    """
+    return a_star_search(problem, heuristic, weight, budget)
+
+
+def beam_search(problem, heuristic=null_heuristic, width=10, budget=None):
+    """
+    Search the tree level by level, only keeping the <width> nodes of lowest
+    f = g + h of every level.
+
+    Expands at most <width> nodes per level, so the work grows linearly with
+    the solution depth, but every pruned node is given up on: it may miss
+    solutions, and gives no guarantee on their cost.
 
-        # Check if this node has been visited with a lower cost
-        if node.state in visited and visited[node.state] <= node.cost:
+    If a budget is given, returns a SearchResult instead (see run_search).
+    """
+    check_closed_set(problem)
+    return run_search(_beam_steps(problem, heuristic, width), budget)
+
+
+def _beam_steps(problem, heuristic, width):
+    visited = set()  # keys of the states reached so far
+    start_state = problem.get_start_state()
+    visited.add(problem.get_state_key(start_state))
+    beam = [Node(start_state, h=heuristic(start_state, problem))]
+
+    while beam:
+        children = []
+        for node in beam:
+            if problem.is_goal_state(node.state):
+                return node.get_actions()
+            yield node
+            for child in expand(problem, node):
+                key = problem.get_state_key(child.state)
+                if key in visited:
+                    continue
+                visited.add(key)
+                child.evaluate(heuristic(child.state, problem))
+                if child.f != float('inf'):
+                    children.append(child)
+        children.sort(key=lambda child: (child.f, -child.cost))
+        beam = children[:width]
+
+    return []  # no solution
+
+
+def anytime_repairing_a_star_search(problem, heuristic=null_heuristic, time_limit=None, weights=(5, 3, 2, 1.5, 1),
+                                    budget=None):
+    """
+    Anytime repairing A* (ARA*): weighted A* searches (see a_star_search) with
+    decreasing <weights>, each one improving on the solution of the last.
+
+    Every search prunes the nodes whose g + h is no lower than the cost of the
+    best solution found so far, and reuses the work of the previous ones: the
+    states it already reached keep their cheapest known cost, and only the
+    queued states and those whose cost improved since they were expanded are
+    searched again. If the search with weight 1 completes, the returned
+    solution is optimal (for a consistent heuristic).
+
+    If <time_limit> (in seconds) runs out, returns the best solution found so
+    far ([] if none).
+
+    If a budget is given, returns a SearchResult instead (see run_search),
+    whose incumbent is the goal node of the best solution found so far.
+    """
+    check_closed_set(problem)
+    steps = _anytime_repairing_a_star_steps(problem, heuristic, weights)
+    if budget is not None:
+        return run_search(steps, budget)
+    result = run_search(steps, Budget(time_limit))
+    if result.complete:
+        return result.actions
+    return result.incumbent.get_actions() if result.incumbent is not None else []
+
+
+def _anytime_repairing_a_star_steps(problem, heuristic, weights):
+    start_state = problem.get_start_state()
+    start_h = heuristic(start_state, problem)
+    start_node = Node(start_state, h=start_h if start_h != float('inf') else 0)
+    best_nodes = {problem.get_state_key(start_state): start_node}  # cheapest node found per state key
+    start_node.key = problem.get_state_key(start_state)
+    queued = [start_node]
+    solution = None
+
+    for weight in weights:
+        open_list = []
+        count = 0
+        for node in queued:
+            if best_nodes[node.key] is node:
+                heapq.heappush(open_list, (node.cost + weight * node.h, -node.cost, count, node))
+                count += 1
+        closed = set()
+        inconsistent = []  # improved states that were already expanded in this search
+
+        while open_list:
+            node = heapq.heappop(open_list)[-1]
+            if best_nodes[node.key] is not node or node.key in closed:
+                continue  # superseded by a cheaper path
+            if solution is not None and node.f >= solution.cost:
+                continue
+            if problem.is_goal_state(node.state):
+                solution = node
+                yield Incumbent(node)
+                break
+            closed.add(node.key)
+
+            yield node
+            for child in expand(problem, node):
+                key = problem.get_state_key(child.state)
+                if key in best_nodes and best_nodes[key].cost <= child.cost:
+                    continue
+                child.evaluate(heuristic(child.state, problem))
+                if child.f == float('inf'):
+                    continue
+                child.key = key
+                best_nodes[key] = child
+                if key in closed:
+                    inconsistent.append(child)
+                else:
+                    heapq.heappush(open_list, (child.cost + weight * child.h, -child.cost, count, child))
+                    count += 1
+
+        queued = [entry[-1] for entry in open_list] + inconsistent
+
+    return solution.get_actions() if solution is not None else []
+
+
+def iterative_deepening_a_star_search(problem, heuristic=null_heuristic, budget=None):
+    """
+    Search the node that has the lowest combined cost and heuristic first, in
+    memory linear in the solution depth.
+
+    Runs depth first searches that cut off the nodes whose f exceeds a bound,
+    starting with the heuristic value of the start state and raising it to the
+    smallest f that was cut off, until a goal is found. Only the current path
+    is kept, so states already reached through other paths are searched again.
+
+    If the problem implements make_move and undo_move, a single state is
+    modified in place (see in_place_depth_first_search).
+
+    If a budget is given, returns a SearchResult instead (see run_search),
+    whose best_node is the node of lowest heuristic value reached (see
+    get_path_node). An in-place search runs on a copy of the start state, so
+    suspending it leaves the start state unchanged.
+    """
+    return run_search(_iterative_deepening_a_star_steps(problem, heuristic), budget)
+
+
+def _iterative_deepening_a_star_steps(problem, heuristic):
+    state = problem.get_start_state()
+    in_place = type(problem).make_move is not SearchProblem.make_move
+    if in_place:
+        state = copy.copy(state)
+    bound = heuristic(state, problem)
+    if bound == float('inf'):
+        bound = 0  # Like a_star_search, always expand the start state
+
+    while bound != float('inf'):
+        actions, bound = yield from _bounded_depth_first_steps(problem, heuristic, state, bound, in_place)
+        if actions is not None:
+            return actions
+
+    return []  # no solution
+
+
+def bounded_depth_first_search(problem, heuristic, state, bound, in_place=False):
+    """
+    One iteration of iterative_deepening_a_star_search: a depth first search
+    from <state> that skips the nodes whose f is above <bound>, and the states
+    already on the current path.
+
+    Returns the actions reaching the first goal found (or None), and the
+    smallest f above <bound> that was cut off (inf if none). <state> itself is
+    always expanded, and an in-place <state> is restored before returning.
+    """
+    return run_search(_bounded_depth_first_steps(problem, heuristic, state, bound, in_place))
+
+
+def _bounded_depth_first_steps(problem, heuristic, state, bound, in_place):
+    if problem.is_goal_state(state):
+        return [], bound
+
+    next_bound = float('inf')
+    states = [state]
+    actions = []
+    undos = []
+    costs = [0]
+    path = [problem.get_state_key(state)]
+    on_path = set(path)
+    stack = [iter(_get_bounded_successors(problem, state, in_place))]
+    best = (heuristic(state, problem), 0)  # the lowest (h, -g) reached
+    yield get_path_node(state, actions, 0, best[0], in_place)
+
+    while stack:
+        successor = next(stack[-1], None)
+        if successor is None:
+            # All children explored, backtrack
+            stack.pop()
+            if actions:
+                on_path.discard(path.pop())
+                costs.pop()
+                actions.pop()
+                states.pop()
+                if in_place:
+                    problem.undo_move(states[-1], undos.pop())
             continue
 
-        visited[node.state] = node.cost
+        if in_place:
+            (action, cost) = successor
+            child = states[-1]
+            undos.append(problem.make_move(child, action))
+        else:
+            (child, action, cost) = successor
 
-        for successor, action, cost in problem.get_successors(node.state):
-            cost_so_far = cost + node.cost
-            heuristic_cost = heuristic(successor, problem)
-            successor_node = Node(successor, node.actions + [action], node, cost_so_far, heuristic_cost)
-            queue.push(successor_node, cost_so_far + heuristic_cost)
+        g = costs[-1] + cost
+        key = problem.get_state_key(child)
+        f = float('inf') if key in on_path else g + heuristic(child, problem)
+        if f <= bound and problem.is_goal_state(child):
+            solution = actions + [action]
+            if in_place:
+                while undos:
+                    problem.undo_move(child, undos.pop())
+            return solution, bound
 
-    return []  # No solution
+        if f > bound:
+            next_bound = min(next_bound, f)
+            if in_place:
+                problem.undo_move(child, undos.pop())
+            continue
+
+        states.append(child)
+        actions.append(action)
+        costs.append(g)
+        path.append(key)
+        on_path.add(key)
+        stack.append(iter(_get_bounded_successors(problem, child, in_place)))
+        if (f - g, -g) < best:
+            best = (f - g, -g)
+            yield get_path_node(child, actions, g, f - g, in_place)
+        else:
+            yield None
+
+    return None, next_bound
+
+
+def _get_bounded_successors(problem, state, in_place):
+    if in_place:
+        return problem.get_successor_moves(state)
+    return problem.get_successors(state)
+
+
+def parallel_a_star_search(problem, heuristic=null_heuristic, workers=None):
+    """
+    A* spread over <workers> processes (one per CPU by default), in the
+    manner of hash-distributed A* (HDA*).
+
+    Every state is owned by the worker its key hashes to (see get_owner),
+    which keeps the open list and the cheapest known cost of its states, and
+    evaluates their heuristic. Workers expand their best nodes and send each
+    successor to its owner through the owner's queue, as compact bytes when
+    the state has a to_bytes method (see Board.to_bytes).
+
+    A goal is only accepted once no worker holds a node of lower f and no
+    node is in flight (see HDAWorker), so the solution is optimal like the
+    one of a_star_search, though possibly a different one. problem.expanded
+    is set to the number of nodes expanded by all the workers.
+
+    Unlike the other searches, it takes no Budget: the workers run until the
+    search is over and can't be suspended.
+    """
+    check_closed_set(problem)
+    workers = workers or os.cpu_count() or 1
+    start_state = problem.get_start_state()
+    inboxes = [multiprocessing.Queue() for _ in range(workers)]
+    results = multiprocessing.Queue()
+    active = multiprocessing.Value('i', 0)
+    incumbent = multiprocessing.Value('d', float('inf'))
+    processes = [multiprocessing.Process(target=run_hda_worker,
+                                         args=(index, problem, heuristic, inboxes, results, active, incumbent))
+                 for index in range(workers)]
+    for process in processes:
+        process.start()
+
+    try:
+        key = problem.get_state_key(start_state)
+        with active.get_lock():
+            active.value += 1  # the token of the message below
+        inboxes[get_owner(key, workers)].put([(encode_state(start_state), key, 0, ())])
+
+        while active.value > 0:
+            if not all(process.is_alive() for process in processes):
+                raise RuntimeError('a search worker exited unexpectedly')
+            time.sleep(0.001)
+
+        for inbox in inboxes:
+            inbox.put(None)
+        expanded = 0
+        solution = None
+        for _ in range(workers):
+            (worker_expanded, worker_solution) = results.get()
+            expanded += worker_expanded
+            if worker_solution is not None and (solution is None or worker_solution[0] < solution[0]):
+                solution = worker_solution
+    finally:
+        for process in processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+    actions = []
+    if solution is not None:
+        # Rebuild the actions from the successor indices of the path
+        state = start_state
+        for index in solution[1]:
+            (state, action, cost) = problem.get_successors(state)[index]
+            actions.append(action)
+    problem.expanded = expanded
+    return actions
+
+
+def get_owner(key, workers):
+    """
+    Returns the index of the worker owning the state <key>. The hash is the
+    same in every process, unlike hash().
+    """
+    return zlib.crc32(key if isinstance(key, bytes) else pickle.dumps(key)) % workers
+
+
+def encode_state(state):
+    """
+    Returns the form <state> is sent to other processes in: state.to_bytes()
+    if the state provides it, otherwise the state itself.
+    """
+    to_bytes = getattr(state, 'to_bytes', None)
+    return state if to_bytes is None else to_bytes()
+
+
+def decode_state(start_state, data):
+    """
+    Returns the state encoded by encode_state as <data>, given the start
+    state of the search.
+    """
+    from_bytes = getattr(start_state, 'from_bytes', None)
+    return data if from_bytes is None else from_bytes(data)
+
+
+def run_hda_worker(index, problem, heuristic, inboxes, results, active, incumbent):
+    HDAWorker(index, problem, heuristic, inboxes, results, active, incumbent).run()
+
+
+class HDAWorker:
+    """
+    A worker process of parallel_a_star_search, owning the states of the
+    keys get_owner maps to <index>.
+
+    Messages are lists of (encoded state, key, g, path) nodes, where path
+    holds the index of each action among the successors of its state (the
+    actions themselves are only rebuilt once a solution is found). None
+    stops the worker, which then puts its expansion count and best solution,
+    as a (cost, path) pair, in <results>.
+
+    The search ends when no worker has a node of f below the cost of the best
+    solution (<incumbent>) and no message is in flight. <active> counts the
+    busy workers plus the messages in flight: a sender adds one per message,
+    and an idle worker receiving a message takes over its count, while a
+    busy one drops it. So it's 0 exactly when the search is over.
+    """
+
+    def __init__(self, index, problem, heuristic, inboxes, results, active, incumbent):
+        self.index = index
+        self.problem = problem
+        self.heuristic = heuristic
+        self.inboxes = inboxes
+        self.results = results
+        self.active = active
+        self.incumbent = incumbent
+
+        self.start_state = problem.get_start_state()
+        self.heap = []
+        self.best_g = dict()  # Maps state keys to the cheapest cost found
+        self.count = 0
+        self.idle = True
+        self.solution = None
+        self.outboxes = [[] for _ in inboxes]
+
+    def run(self):
+        while True:
+            if not self.has_work():
+                if not self.idle:
+                    self.idle = True
+                    with self.active.get_lock():
+                        self.active.value -= 1
+                if not self.receive(block=True):
+                    break
+            elif not self.receive(block=False):
+                break
+            if self.has_work():
+                self.expand_next()
+                self.send()
+
+        self.results.put((self.problem.expanded if hasattr(self.problem, 'expanded') else 0, self.solution))
+
+    def has_work(self):
+        return bool(self.heap) and self.heap[0][0] < self.incumbent.value
+
+    def receive(self, block):
+        """
+        Adds the nodes of the waiting messages (waiting for one if <block>).
+        Returns False once the worker is stopped.
+        """
+        while True:
+            try:
+                message = self.inboxes[self.index].get(block)
+            except queue.Empty:
+                return True
+            if message is None:
+                return False
+            if self.idle:
+                self.idle = False
+            else:
+                with self.active.get_lock():
+                    self.active.value -= 1
+            for (data, key, g, path) in message:
+                if self.best_g.get(key, float('inf')) > g:
+                    self.add(decode_state(self.start_state, data), key, g, path)
+            block = False
+
+    def add(self, state, key, g, path):
+        if self.best_g.get(key, float('inf')) <= g:
+            return
+        self.best_g[key] = g
+        h = self.heuristic(state, self.problem)
+        if h == float('inf'):
+            if path:
+                return
+            h = 0  # Like a_star_search, always expand the start state
+        if g + h < self.incumbent.value:
+            heapq.heappush(self.heap, (g + h, -g, self.count, state, key, g, path))
+            self.count += 1
+
+    def expand_next(self):
+        (f, _, _, state, key, g, path) = heapq.heappop(self.heap)
+        if self.best_g[key] < g:
+            return  # superseded by a cheaper path
+
+        if self.problem.is_goal_state(state):
+            with self.incumbent.get_lock():
+                if g < self.incumbent.value:
+                    self.incumbent.value = g
+                    self.solution = (g, path)
+            return
+
+        workers = len(self.inboxes)
+        for (i, (child, action, cost)) in enumerate(self.problem.get_successors(state)):
+            child_key = self.problem.get_state_key(child)
+            owner = get_owner(child_key, workers)
+            if owner == self.index:
+                self.add(child, child_key, g + cost, path + (i,))
+            else:
+                self.outboxes[owner].append((encode_state(child), child_key, g + cost, path + (i,)))
+
+    def send(self):
+        for (owner, outbox) in enumerate(self.outboxes):
+            if outbox:
+                with self.active.get_lock():
+                    self.active.value += 1
+                self.inboxes[owner].put(outbox)
+                self.outboxes[owner] = []
+
+
+def run_search(steps, budget=None):
+    """
+    Runs a search, given as the generator <steps> that yields once per node
+    expansion (the node about to be expanded, or None) and returns the
+    solution. Anytime searches also yield an Incumbent for each solution they
+    improve on.
+
+    Without a budget, runs it to the end and returns the solution. Otherwise,
+    runs it until the Budget is spent and returns a SearchResult, which can
+    resume the search later.
+
+    Every search of this module takes a budget, except for
+    parallel_a_star_search: its worker processes can't be suspended.
+    """
+    if budget is None:
+        while True:
+            try:
+                next(steps)
+            except StopIteration as stop:
+                return stop.value
+    return SearchResult(steps).resume(budget)
+
+
+class Budget:
+    """
+    A limit on the work of a search call: <time_limit> seconds of wall-clock
+    time and/or <max_expansions> node expansions (None for no limit).
+
+    Searches check it cooperatively, between node expansions, so a call
+    overruns its time limit by at most one expansion. A Budget can be reused:
+    its limits apply to each call it's passed to.
+    """
+
+    def __init__(self, time_limit=None, max_expansions=None):
+        self.time_limit = time_limit
+        self.max_expansions = max_expansions
+        self.deadline = None
+        self.expansions = 0
+
+    def start(self):
+        """
+        Starts counting the time and expansions of a new call
+        """
+        self.deadline = None if self.time_limit is None else time.time() + self.time_limit
+        self.expansions = 0
+
+    def spend(self):
+        """
+        Records an expansion, returning False once the budget is spent
+        """
+        self.expansions += 1
+        if self.max_expansions is not None and self.expansions >= self.max_expansions:
+            return False
+        return self.deadline is None or time.time() < self.deadline
+
+
+class Incumbent:
+    """
+    Yielded by the steps of an anytime search (see run_search) when it finds
+    a solution better than the last one, reached by <node>.
+    """
+
+    def __init__(self, node):
+        self.node = node
+
+
+class SearchResult:
+    """
+    The outcome of a search run with a Budget (see run_search).
+
+    - complete: True once the search is over
+    - actions: the solution ([] if there is none), or None while the search
+      isn't complete
+    - expanded: the number of nodes expanded so far, over all calls
+    - best_node: the expanded node of lowest heuristic value (then of highest
+      cost) so far, and partial_actions the actions reaching it. best_node
+      keeps its state, even for problems whose expanded nodes drop theirs
+      (see expand). Searches that don't keep nodes
+      (in_place_depth_first_search, iterative_deepening_a_star_search) only
+      yield the nodes that improve on their best one (see get_path_node).
+    - incumbent: the goal node of the best solution found so far by an
+      anytime search (anytime_repairing_a_star_search), or None
+
+    An incomplete search can be continued with resume, which expands more
+    nodes from where the last call stopped.
+    """
+
+    def __init__(self, steps):
+        self.steps = steps
+        self.complete = False
+        self.actions = None
+        self.expanded = 0
+        self.best_node = None
+        self.best_state = None
+        self.incumbent = None
+
+    def resume(self, budget):
+        """
+        Continues the search until it's complete or <budget> is spent.
+        Returns self.
+        """
+        if self.complete:
+            return self
+        budget.start()
+        while True:
+            try:
+                node = next(self.steps)
+            except StopIteration as stop:
+                self.complete = True
+                self.actions = stop.value
+                self.steps = None
+                break
+
+            if isinstance(node, Incumbent):
+                self.incumbent = node.node
+                continue
+            self.expanded += 1
+            if node is not None and (self.best_node is None or
+                                     (node.h, -node.cost) < (self.best_node.h, -self.best_node.cost)):
+                # Nodes are yielded before their expansion may drop their state
+                self.best_node = node
+                self.best_state = node.state
+            if not budget.spend():
+                break
+        if self.best_node is not None:
+            self.best_node.state = self.best_state
+        return self
+
+    @property
+    def partial_actions(self):
+        return self.best_node.get_actions() if self.best_node is not None else []
+
+
+class OpenList:
+    """
+    The open list of a best-first search: a binary heap of nodes ordered by f,
+    then by higher g (lower h), then by insertion order, so ties are broken
+    deterministically.
+
+    Instead of a decrease-key operation, it keeps the cheapest known cost of
+    every state key (for states that are queued or were already expanded). A
+    node is only worth queueing if register() accepts it, and queued nodes
+    whose state was since reached more cheaply are stale and should be skipped
+    when popped.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.best_g = dict()  # Maps state keys to the cheapest cost found
+        self.count = 0
+
+    def register(self, node, key):
+        """
+        Records <node> as the cheapest path to the state <key>. Returns False
+        (leaving the table as is) if that state was already reached at least
+        as cheaply.
+        """
+        if key in self.best_g and self.best_g[key] <= node.cost:
+            return False
+        self.best_g[key] = node.cost
+        node.key = key
+        return True
+
+    def is_stale(self, node):
+        """
+        Returns True if a cheaper path to <node>'s state was registered since
+        """
+        return self.best_g[node.key] < node.cost
+
+    def push(self, node):
+        heapq.heappush(self.heap, (node.f, -node.cost, self.count, node))
+        self.count += 1
+
+    def pop(self):
+        return heapq.heappop(self.heap)[-1]
+
+    def isEmpty(self):
+        return len(self.heap) == 0
+
+
+def get_state_key(state):
+    """
+    Returns a compact, hashable key identifying <state> for closed sets:
+    state.key() if the state provides one (e.g. boards), otherwise the state
+    itself.
+    """
+    key = getattr(state, 'key', None)
+    if key is None:
+        return state
+    return key()
+
+
+def check_closed_set(problem):
+    """
+    Raises a ValueError if <problem> can't be searched with a closed set (see
+    SearchProblem.path_dependent_successors).
+    """
+    if problem.path_dependent_successors:
+        raise ValueError("this search keeps a closed set, so it doesn't accept problems with path-dependent "
+                         "successors (see SearchProblem.path_dependent_successors)")
+
+
+def get_canonical_key(state, symmetries):
+    """
+    Returns the smallest of the keys of <state>'s images by <symmetries> (see
+    board.get_symmetries), so states that are mirror images or rotations of
+    each other share a key.
+    """
+    return min(state.key(symmetry) for symmetry in symmetries)
+
+
+def expand(problem, node, weight=1):
+    """
+    Returns the child nodes of <node>. If <problem> has lazy successors, the
+    children are LazyNodes whose states are built when first needed (<weight>
+    is the factor applied to the heuristic, see LazyNode).
+
+    Otherwise the children don't need <node>'s state anymore, so it is dropped
+    and only the parent links needed to rebuild the path are kept.
+    """
+    if problem.lazy_successors:
+        return [LazyNode(problem, node, action, node.cost + cost, weight)
+                for action, cost in problem.get_successor_moves(node.state)]
+    children = [Node(successor, node, action, node.cost + cost)
+                for successor, action, cost in problem.get_successors(node.state)]
+    node.state = None
+    return children
+
+
+def get_path_node(state, actions, g=0, h=0, copy_state=True):
+    """
+    Returns a Node for <state>, reached from the start state by <actions>,
+    for the searches that only keep the current path. Its ancestors hold no
+    state, and <state> is copied (if <copy_state>) as the search goes on
+    modifying it.
+    """
+    node = Node(None)
+    for action in actions:
+        node = Node(None, node, action)
+    node.state = copy.copy(state) if copy_state else state
+    node.cost = g
+    node.evaluate(h)
+    return node
 
 
 class Node:
     """
     :parameter state: the state of the board when reaching this node
-    :parameter actions: list of actions to reach this state from the start state
     :parameter parent: the parent node
+    :parameter action: the action leading from the parent to this state
     :parameter g: the cost to reach this state
     :parameter h: the heuristic value of this state
+
+    Nodes only link to their parent; the actions leading to a node are
+    rebuilt by get_actions once a goal is found.
     """
-    def __init__(self, state, actions, parent=None, g=0, h=0):
+    evaluated = True
+    key = None  # set once the node is registered in an OpenList
+
+    def __init__(self, state, parent=None, action=None, g=0, h=0):
         self.state = state
-        self.actions = actions
         self.parent = parent
+        self.action = action
         self.cost = g
+        self.h = h
         self.f = g + h  # cost + heuristic
 
-    def __lt__(self, other):
-        return True
+    def get_actions(self):
+        """
+        Returns the list of actions to reach this state from the start state
+        """
+        actions = []
+        node = self
+        while node.parent is not None:
+            actions.append(node.action)
+            node = node.parent
+        actions.reverse()
+        return actions
+
+    def evaluate(self, h):
+        """
+        Sets the heuristic value of this node
+        """
+        self.h = h
+        self.f = self.cost + h
+        self.evaluated = True
+
+
+class LazyNode(Node):
+    """
+    A node whose state is only built, from its parent's state, when it is first
+    accessed. Until evaluate is called, h is the lower bound its parent gives.
+
+    :parameter problem: the problem used to build the state
+    :parameter parent: the parent node
+    :parameter action: the action leading from the parent to this node
+    :parameter g: the cost to reach this state
+    :parameter weight: the factor applied to the heuristic values (see a_star_search)
+    """
+    evaluated = False
+
+    def __init__(self, problem, parent, action, g=0, weight=1):
+        h = max(parent.h - weight * (g - parent.cost), 0) if parent.h != float('inf') else 0
+        Node.__init__(self, None, parent, action, g, h)
+        self.problem = problem
+
+    @property
+    def state(self):
+        if self._state is None:
+            self._state = self.problem.get_successor(self.parent.state, self.action)
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        self._state = state
 
 
 # Abbreviations
 bfs = breadth_first_search
 dfs = depth_first_search
 astar = a_star_search
+idastar = iterative_deepening_a_star_search
+wastar = weighted_a_star_search
+beam = beam_search
+arastar = anytime_repairing_a_star_search
+hdastar = parallel_a_star_search
 ucs = uniform_cost_search
\ No newline at end of file
@@ -65,25 +65,21 @@ class PriorityQueue:
 
       Note that this PriorityQueue does not allow you to change the priority
       of an item.  However, you may insert the same item multiple times with
-      different priorities.
+      different priorities. Items with equal priorities are popped in the
+      order they were pushed.
     """
 
     def __init__(self):
         self.heap = []
-        self.init = False
+        self.count = 0
 
     def push(self, item, priority):
-        if not self.init:
-            self.init = True
-            try:
-                item < item
-            except:
-                item.__class__.__lt__ = lambda x, y: (True)
-        pair = (priority, item)
-        heapq.heappush(self.heap, pair)
+        entry = (priority, self.count, item)
+        heapq.heappush(self.heap, entry)
+        self.count += 1
 
     def pop(self):
-        (priority, item) = heapq.heappop(self.heap)
+        (_, _, item) = heapq.heappop(self.heap)
         return item
 
     def isEmpty(self):
@@ -0,0 +1,73 @@
+import random
+
+import numpy as np
+
+"""
+Zobrist hashing of Blokus positions.
+"""
+
+# Number of times boards with the same key turned out to differ when compared
+collisions = 0
+
+_tables = {}
+
+
+class ZobristTable(object):
+    """
+    A ZobristTable holds a random 64-bit key for:
+    - tiles[player][cell]: a tile of <player> on cell y * board_w + x
+    - pieces[player][piece_index]: <player> having used the piece
+    - turns[player]: <player> being the last one to have moved, for tables
+      of positions where the player to move matters
+
+    The key of a position is the xor of the keys of its tiles and used
+    pieces, so playing a move xors in get_move_key, and undoing it xors it
+    out again. Keys are drawn from a fixed seed, so they're the same in every
+    process.
+    """
+
+    def __init__(self, num_players, board_w, board_h, num_pieces, seed=0):
+        rng = random.Random(seed)
+        self.board_w = board_w
+        self.tiles = [[rng.getrandbits(64) for _ in range(board_w * board_h)] for _ in range(num_players)]
+        self.pieces = [[rng.getrandbits(64) for _ in range(num_pieces)] for _ in range(num_players)]
+        self.turns = [rng.getrandbits(64) for _ in range(num_players)]
+        self._move_keys = {}
+
+    def get_move_key(self, player, move):
+        """
+        Returns the xor of the keys of the tiles and piece of <player>'s <move>
+        """
+        cache_key = (player, move.placement_id)
+        if move.placement_id is not None and cache_key in self._move_keys:
+            return self._move_keys[cache_key]
+        tiles = self.tiles[player]
+        key = self.pieces[player][move.piece_index]
+        for (xi, yi) in move.orientation:
+            key ^= tiles[(move.y + yi) * self.board_w + move.x + xi]
+        if move.placement_id is not None:
+            self._move_keys[cache_key] = key
+        return key
+
+    def get_key(self, board):
+        """
+        Computes the key of <board> from scratch
+        """
+        key = 0
+        for (y, x) in zip(*np.nonzero(board.state != -1)):
+            key ^= self.tiles[board.state[y, x]][y * self.board_w + x]
+        for (player, piece_index) in zip(*np.nonzero(~board.pieces)):
+            key ^= self.pieces[player][piece_index]
+        return key
+
+
+def get_zobrist_table(num_players, piece_list, board_w, board_h):
+    """
+    Returns the ZobristTable of <piece_list> on a <board_w> x <board_h> board,
+    shared by every such board so their keys can be compared. Move keys are
+    cached by placement id, which is only meaningful for a given piece list.
+    """
+    table_key = (num_players, tuple(piece_list), board_w, board_h)
+    if table_key not in _tables:
+        _tables[table_key] = ZobristTable(num_players, board_w, board_h, piece_list.get_num_pieces())
+    return _tables[table_key]